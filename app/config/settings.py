@@ -10,8 +10,11 @@ class Settings(BaseSettings):
     
     # Database Configuration
     database_url: str
-    database_pool_size: int = 10
-    database_max_overflow: int = 20
+    database_pool_size: int = 20
+    database_max_overflow: int = 40
+    database_pool_timeout: int = 5
+    database_pool_recycle: int = 1800
+    database_statement_cache_size: int = 1024
     
     # Redis Configuration
     redis_url: str = "redis://redis:6379"
@@ -20,13 +23,20 @@ class Settings(BaseSettings):
     # OCR Configuration
     tesseract_path: Optional[str] = "/usr/bin/tesseract"
     google_vision_api_key: Optional[str] = None
+    ocr_threshold_mode: Literal["otsu", "adaptive", "sauvola"] = "otsu"
+    ocr_workers: Optional[int] = None
     
     # AI Configuration
     ai_provider: Literal["openai", "gemini", "none"] = "none"
     openai_api_key: Optional[str] = None
     gemini_api_key: Optional[str] = None
-    ai_model_openai: str = "gpt-3.5-turbo"
+    ai_model_openai: str = "gpt-4o-mini"
     ai_model_gemini: str = "gemini-2.0-flash"
+    ai_max_concurrency: int = 5
+    ai_rpm: int = 10
+    ai_tpm: int = 40000
+    ai_batch_size: int = 8
+    ai_batch_token_limit: int = 3000
     
     # Internationalization
     default_language: str = "en"
@@ -89,5 +99,7 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
         case_sensitive = False
+        # Loaded once at import; treat the instance as read-only configuration
+        allow_mutation = False
 
 settings = Settings()
\ No newline at end of file
@@ -1,7 +1,11 @@
 import redis
-import json
+import orjson
 import pickle
-from typing import Any, Optional, Union
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional, Union
 from datetime import timedelta
 import logging
 
@@ -9,6 +13,9 @@ from app.config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Entry cap for the in-memory fallback; least recently used keys are evicted beyond it
+MEMORY_CACHE_MAX_ENTRIES = 1024
+
 class CacheService:
     def __init__(self):
         try:
@@ -24,20 +31,22 @@ class CacheService:
         except Exception as e:
             logger.warning(f"Redis connection failed: {e}. Falling back to in-memory cache")
             self.redis_client = None
-            self._memory_cache = {}
+            # key -> (serialized value, monotonic expiry), kept in recency order so TTLs and the size cap match Redis;
+            # values are stored serialized so every get returns a fresh copy, as it does from Redis
+            self._memory_cache = OrderedDict()
     
     def _serialize(self, value: Any) -> bytes:
         """Serialize value for storage"""
         try:
-            return json.dumps(value).encode('utf-8')
-        except (TypeError, ValueError):
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
             return pickle.dumps(value)
     
     def _deserialize(self, value: bytes) -> Any:
         """Deserialize value from storage"""
         try:
-            return json.loads(value.decode('utf-8'))
-        except (json.JSONDecodeError, UnicodeDecodeError):
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
             return pickle.loads(value)
     
     def get(self, key: str) -> Optional[Any]:
@@ -48,7 +57,13 @@ class CacheService:
                 if value is not None:
                     return self._deserialize(value)
             else:
-                return self._memory_cache.get(key)
+                entry = self._memory_cache.get(key)
+                if entry is not None:
+                    value, expires_at = entry
+                    if expires_at > time.monotonic():
+                        self._memory_cache.move_to_end(key)
+                        return self._deserialize(value)
+                    del self._memory_cache[key]
         except Exception as e:
             logger.error(f"Cache get error for key {key}: {e}")
         return None
@@ -66,7 +81,10 @@ class CacheService:
                 serialized_value = self._serialize(value)
                 return self.redis_client.setex(key, ttl, serialized_value)
             else:
-                self._memory_cache[key] = value
+                self._memory_cache[key] = (self._serialize(value), time.monotonic() + ttl)
+                self._memory_cache.move_to_end(key)
+                while len(self._memory_cache) > MEMORY_CACHE_MAX_ENTRIES:
+                    self._memory_cache.popitem(last=False)
                 return True
         except Exception as e:
             logger.error(f"Cache set error for key {key}: {e}")
@@ -83,12 +101,39 @@ class CacheService:
             logger.error(f"Cache delete error for key {key}: {e}")
             return False
     
+    def memoize(self, key: Callable[..., str], ttl: Optional[Union[int, timedelta]] = None):
+        """Cache a function's result under key(*args, **kwargs); works for sync and async functions"""
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    cache_key = key(*args, **kwargs)
+                    value = self.get(cache_key)
+                    if value is None:
+                        value = await func(*args, **kwargs)
+                        if value is not None:
+                            self.set(cache_key, value, ttl)
+                    return value
+                return async_wrapper
+            
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                cache_key = key(*args, **kwargs)
+                value = self.get(cache_key)
+                if value is None:
+                    value = func(*args, **kwargs)
+                    if value is not None:
+                        self.set(cache_key, value, ttl)
+                return value
+            return wrapper
+        return decorator
+    
     def get_user_cache_key(self, user_id: int, suffix: str) -> str:
         """Generate user-specific cache key"""
         return f"user:{user_id}:{suffix}"
     
-    def cache_user_suggestions(self, user_id: int, suggestions: list, ttl: int = 1800):
-        """Cache AI suggestions for user"""
+    def cache_user_suggestions(self, user_id: int, suggestions: list, ttl: int = 259200):
+        """Cache AI suggestions for user; entries are invalidated when the user's data changes"""
         key = self.get_user_cache_key(user_id, "suggestions")
         return self.set(key, suggestions, ttl)
     
@@ -96,5 +141,51 @@ class CacheService:
         """Get cached AI suggestions for user"""
         key = self.get_user_cache_key(user_id, "suggestions")
         return self.get(key)
+    
+    def invalidate_user_suggestions(self, user_id: int) -> bool:
+        """Drop cached AI suggestions after the user's list or receipts change"""
+        key = self.get_user_cache_key(user_id, "suggestions")
+        return self.delete(key)
+
+    def cache_user_stats(self, user_id: int, stats: dict, ttl: int = 3600):
+        """Cache a user's /stats aggregates; entries are invalidated when receipts or currency change"""
+        key = self.get_user_cache_key(user_id, "stats")
+        return self.set(key, stats, ttl)
+    
+    def get_user_stats(self, user_id: int) -> Optional[dict]:
+        """Get cached /stats aggregates for user"""
+        key = self.get_user_cache_key(user_id, "stats")
+        return self.get(key)
+    
+    def invalidate_user_stats(self, user_id: int) -> bool:
+        """Drop cached /stats aggregates after the user's receipts or currency change"""
+        key = self.get_user_cache_key(user_id, "stats")
+        return self.delete(key)
+    
+    def get_product_cache_key(self, name: str) -> str:
+        """Product id cache key; names are matched case-insensitively, like receipt ingest's product_key"""
+        return f"product:id:{name.strip().lower()}"
+    
+    def cache_product_id(self, name: str, product_id: int, ttl: int = 300):
+        """Cache the product id resolved for a product name"""
+        return self.set(self.get_product_cache_key(name), product_id, ttl)
+    
+    def get_product_id(self, name: str) -> Optional[int]:
+        """Get the cached product id for a product name"""
+        return self.get(self.get_product_cache_key(name))
+    
+    def invalidate_product_ids(self, names: Iterable[str]) -> bool:
+        """Drop cached product ids after receipt ingest upserts those names"""
+        keys = [self.get_product_cache_key(name) for name in names]
+        if not keys:
+            return False
+        try:
+            if self.redis_client:
+                return bool(self.redis_client.delete(*keys))
+            else:
+                return any([self._memory_cache.pop(key, None) is not None for key in keys])
+        except Exception as e:
+            logger.error(f"Cache delete error for product keys: {e}")
+            return False
 
 cache = CacheService()
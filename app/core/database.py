@@ -1,26 +1,55 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import QueuePool
-from contextlib import contextmanager
-from typing import Generator
+from contextlib import contextmanager, asynccontextmanager
+from typing import Generator, AsyncGenerator
+from datetime import date, timedelta
+import asyncio
 import logging
+import orjson
 
 from app.config.settings import settings
 from app.models.product import Base
 
 logger = logging.getLogger(__name__)
 
+def _json_dumps(value) -> str:
+    """orjson-backed serializer for JSON columns (SQLAlchemy expects str)"""
+    return orjson.dumps(value).decode()
+
 # Create engine with connection pooling
 engine = create_engine(
     settings.database_url,
     poolclass=QueuePool,
     pool_size=settings.database_pool_size,
     max_overflow=settings.database_max_overflow,
+    pool_timeout=settings.database_pool_timeout,
+    pool_recycle=settings.database_pool_recycle,
     pool_pre_ping=True,
+    json_serializer=_json_dumps,
+    json_deserializer=orjson.loads,
+    echo=settings.log_level == "DEBUG"
+)
+
+# Async engine on asyncpg for handlers running inside the bot's event loop
+async_engine = create_async_engine(
+    make_url(settings.database_url).set(drivername="postgresql+asyncpg"),
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
+    pool_timeout=settings.database_pool_timeout,
+    pool_recycle=settings.database_pool_recycle,
+    pool_pre_ping=True,
+    # Each pooled connection keeps its prepared statements, so repeated queries skip parse/plan
+    connect_args={"prepared_statement_cache_size": settings.database_statement_cache_size},
+    json_serializer=_json_dumps,
+    json_deserializer=orjson.loads,
     echo=settings.log_level == "DEBUG"
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 def create_tables():
     """Create all database tables"""
@@ -31,6 +60,67 @@ def create_tables():
         logger.error(f"Error creating database tables: {e}")
         raise
 
+def _create_price_history_partition(conn, partition: str, start: date, end: date):
+    """Create one monthly price_history partition, moving any rows already caught by the default partition"""
+    bounds = {"start": start, "end": end}
+    in_range = "recorded_at >= :start AND recorded_at < :end"
+    # Partition bounds cannot be bound parameters in DDL; both are ISO dates built from date objects
+    create = text(
+        f"CREATE TABLE {partition} PARTITION OF price_history "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+    stranded = conn.scalar(text(f"SELECT EXISTS (SELECT 1 FROM price_history_default WHERE {in_range})"), bounds)
+    if not stranded:
+        conn.execute(create)
+        return
+    
+    # Postgres refuses a new partition whose range already has rows in the default one, so move them
+    # across with the default detached; the parent stays locked until the transaction commits
+    logger.warning(f"Moving price history rows from the default partition into {partition}")
+    conn.execute(text("ALTER TABLE price_history DETACH PARTITION price_history_default"))
+    conn.execute(create)
+    conn.execute(text(f"INSERT INTO {partition} SELECT * FROM price_history_default WHERE {in_range}"), bounds)
+    conn.execute(text(f"DELETE FROM price_history_default WHERE {in_range}"), bounds)
+    conn.execute(text("ALTER TABLE price_history ATTACH PARTITION price_history_default DEFAULT"))
+
+def ensure_price_history_partitions(months_ahead: int = 1):
+    """Create the default price_history partition and monthly ones for the current and upcoming months"""
+    month = date.today().replace(day=1)
+    try:
+        with engine.begin() as conn:
+            # Catch-all partition so inserts never depend on the scheduled job having run
+            conn.execute(text("CREATE TABLE IF NOT EXISTS price_history_default PARTITION OF price_history DEFAULT"))
+            for _ in range(months_ahead + 1):
+                next_month = (month + timedelta(days=32)).replace(day=1)
+                partition = f"price_history_{month:%Y_%m}"
+                if conn.scalar(text("SELECT to_regclass(:name)"), {"name": partition}) is None:
+                    _create_price_history_partition(conn, partition, month, next_month)
+                month = next_month
+        logger.info("Price history partitions ensured")
+    except Exception as e:
+        logger.error(f"Error creating price history partitions: {e}")
+        raise
+
+def ensure_price_history_partitions_job():
+    """Scheduler entry point; a failure is logged and retried next run instead of stopping the scheduler thread"""
+    try:
+        ensure_price_history_partitions()
+    except Exception:
+        pass
+
+async def warm_async_pool(connections: int = 5):
+    """Open async pool connections at startup so the first handlers skip connection setup"""
+    async def ping():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    
+    # Concurrent checkouts force distinct connections into the pool
+    try:
+        await asyncio.gather(*(ping() for _ in range(min(connections, settings.database_pool_size))))
+        logger.info("Async database pool warmed up")
+    except Exception as e:
+        logger.error(f"Error warming up async database pool: {e}")
+
 @contextmanager
 def get_db() -> Generator[Session, None, None]:
     """Database session context manager"""
@@ -45,6 +135,18 @@ def get_db() -> Generator[Session, None, None]:
     finally:
         db.close()
 
+@asynccontextmanager
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Async database session context manager"""
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Database error: {e}")
+            raise
+
 def get_db_session() -> Session:
     """Get database session for dependency injection"""
     return SessionLocal()
\ No newline at end of file
@@ -0,0 +1,42 @@
+from datetime import timedelta
+from sqlalchemy import exists, func, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import User as TelegramUser
+from app.models import User
+
+# last_active is only rewritten when it is older than this, so busy users do not churn their row
+LAST_ACTIVE_RESOLUTION = timedelta(minutes=5)
+
+async def get_or_create_user(db: AsyncSession, tg_user: TelegramUser) -> User:
+    """Get or create the bot user for a Telegram user in a single round-trip"""
+    stmt = pg_insert(User).values(
+        telegram_id=tg_user.id,
+        username=tg_user.username,
+        first_name=tg_user.first_name,
+        last_name=tg_user.last_name
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={
+            "username": stmt.excluded.username,
+            "first_name": stmt.excluded.first_name,
+            "last_name": stmt.excluded.last_name,
+            "last_active": func.now()
+        },
+        where=(
+            User.last_active.is_(None)
+            | (User.last_active < func.now() - LAST_ACTIVE_RESOLUTION)
+            | User.username.is_distinct_from(stmt.excluded.username)
+            | User.first_name.is_distinct_from(stmt.excluded.first_name)
+            | User.last_name.is_distinct_from(stmt.excluded.last_name)
+        )
+    )
+
+    # A skipped update returns no row, so fall back to the existing one within the same statement
+    upserted = stmt.returning(*User.__table__.c).cte("upserted")
+    query = union_all(
+        select(upserted),
+        select(User.__table__).where(User.telegram_id == tg_user.id, ~exists(select(upserted.c.id)))
+    )
+    return await db.scalar(select(User).from_statement(query), execution_options={"populate_existing": True})
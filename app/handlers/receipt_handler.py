@@ -1,56 +1,52 @@
-import os
+import asyncio
 from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
-from app.core.database import get_db
-from app.models import Receipt, ReceiptItem, Product
-from app.services import ocr_service, ai_service
+from sqlalchemy import func, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.core.database import get_async_db
+from app.core.cache import cache
+from app.models import Receipt, ReceiptItem, Product, PriceHistory
+from app.services.ocr_service import ocr_service
+from app.services.ai_service import ai_service
 from app.utils import i18n
-from app import settings
+from app.utils.helpers import parse_receipt_date
+from app.config.settings import settings
 import logging
-from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
-@contextmanager
-def temp_file_manager(file_id: str):
-    file_path = f"temp/{file_id}.jpg"
-    os.makedirs("temp", exist_ok=True)
-    try:
-        yield file_path
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
 async def process_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message.photo:
         await update.message.reply_text(i18n.get_text("cmd_receipt", update.effective_user.language_code))
         return
     
-    photo = update.message.photo[-1]
-    file = await photo.get_file()
+    try:
+        photo = update.message.photo[-1]
+        file = await photo.get_file()
     
-    with temp_file_manager(photo.file_id) as file_path:
+        # The photo stays in memory; there is no temp file to write, re-read and clean up
         try:
-            await file.download(file_path)
+            image_data = bytes(await file.download_as_bytearray())
         except TelegramError as te:
             logger.error(f"Failed to download photo: {te}")
             await update.message.reply_text("Failed to download receipt image. Please try again.")
             return
         
-        with open(file_path, "rb") as image_file:
-            image_data = image_file.read()
-        receipt_data = ocr_service.extract_text_from_receipt(image_data)
-        
+        receipt_data = await ocr_service.extract_text_from_receipt_async(image_data)
+    
         if not receipt_data["items"]:
             await update.message.reply_text(i18n.get_text("no_suggestions_data", update.effective_user.language_code))
             return
+    
+        # OCR returns the date as printed; asyncpg only binds real datetimes to the DateTime column
+        purchase_date = parse_receipt_date(receipt_data["date"]) if receipt_data["date"] else None
         
-        with get_db() as db:
+        async with get_async_db() as db:
             receipt = Receipt(
                 user_id=update.effective_user.id,
-                purchase_date=datetime.now() if not receipt_data["date"] else receipt_data["date"],
+                purchase_date=purchase_date or datetime.now(),
                 store_name=receipt_data["store_name"],
                 total_amount=receipt_data["total"] or 0.0,
                 ocr_confidence=receipt_data["confidence"],
@@ -58,40 +54,71 @@ async def process_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 processing_status="completed"
             )
             db.add(receipt)
-            db.commit()
+            await db.flush()
             
-            for item in receipt_data["items"]:
-                product = db.query(Product).filter(Product.name.ilike(f"%{item['name']}%")).first()
-                if not product:
-                    product = Product(name=item["name"], category="unknown", last_price=item["unit_price"])
-                    db.add(product)
-                    db.commit()
-                
-                receipt_item = ReceiptItem(
-                    receipt_id=receipt.id,
-                    product_id=product.id,
-                    item_name=item["name"],
-                    quantity=item["quantity"],
-                    unit_price=item["unit_price"],
-                    total_price=item["total_price"],
-                    confidence_score=item.get("confidence", receipt_data["confidence"])
-                )
-                db.add(receipt_item)
+            # One upsert for every product on the receipt; ON CONFLICT can only
+            # touch a row once per statement, so collapse repeated names first.
+            # OCR casing varies line to line, so "MILK" and "Milk" resolve to one product,
+            # within a receipt and, through the lower(name) unique index, across receipts.
+            # This upsert is the only writer of products.last_price for receipt lines.
+            # Keys stay in a local list; receipt_data may be the cached OCR result and is left untouched.
+            product_keys = [item["name"].strip().lower() for item in receipt_data["items"]]
+            product_rows = {}
+            for product_key, item in zip(product_keys, receipt_data["items"]):
+                product_rows.setdefault(product_key, {
+                    "name": item["name"], "brand": "", "category": "unknown", "last_price": item["unit_price"]
+                })
+            stmt = pg_insert(Product).values(list(product_rows.values()))
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[func.lower(Product.name), Product.brand],
+                set_={"last_price": stmt.excluded.last_price}
+            ).returning(Product.id, Product.name)
+            product_ids = {name.strip().lower(): product_id for product_id, name in (await db.execute(stmt)).all()}
+            item_product_ids = [product_ids[product_key] for product_key in product_keys]
+        
+            # Core executemany insert: one round-trip for all lines, no identity-map bookkeeping
+            await db.execute(insert(ReceiptItem), [
+                {
+                    "receipt_id": receipt.id,
+                    "product_id": product_id,
+                    "item_name": item["name"],
+                    "quantity": item["quantity"],
+                    "unit_price": item["unit_price"],
+                    "total_price": item["total_price"],
+                    "confidence_score": item.get("confidence", receipt_data["confidence"])
+                }
+                for product_id, item in zip(item_product_ids, receipt_data["items"])
+            ])
             
-            db.commit()
+            if settings.enable_price_tracking:
+                await db.execute(insert(PriceHistory), [
+                    {"product_id": product_id, "price": item["unit_price"]}
+                    for product_id, item in zip(item_product_ids, receipt_data["items"])
+                ])
         
-        await update.message.reply_text(
+            await db.commit()
+        
+        cache.invalidate_user_suggestions(update.effective_user.id)
+        cache.invalidate_user_stats(update.effective_user.id)
+        cache.invalidate_product_ids(product_rows)
+    
+        confirmation = update.message.reply_text(
             i18n.get_text("item_added", update.effective_user.language_code).format(item=f"{len(receipt_data['items'])} items")
         )
-        
-        if settings.enable_ai_suggestions:
-            suggestions = await ai_service.generate_suggestions([item["name"] for item in receipt_data["items"]])
+    
+        if not settings.enable_ai_suggestions:
+            await confirmation
+        else:
+            # The confirmation and the suggestion request are independent round-trips, so overlap them
+            _, suggestions = await asyncio.gather(
+                confirmation, ai_service.generate_suggestions([item["name"] for item in receipt_data["items"]])
+            )
             if suggestions:
                 await update.message.reply_text(
                     i18n.get_text("ai_suggestions_title", update.effective_user.language_code, provider="") +
                     "\n" + ", ".join(suggestions)
                 )
-    
+
     except Exception as e:
         logger.error(f"Error processing receipt: {e}")
         await update.message.reply_text(i18n.get_text("error_occurred", update.effective_user.language_code))
\ No newline at end of file
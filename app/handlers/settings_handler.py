@@ -1,26 +1,20 @@
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
-from app.services.database import get_db
-from app.models import User
+from app.core.database import get_async_db
+from app.core.cache import cache
+from app.handlers.base import get_or_create_user
 from app.services.i18n_service import i18n
-from app.utils.validators import validate_item_name
+from app.utils.validators import (
+    SUPPORTED_CURRENCIES, validate_currency_code, validate_item_name, validate_language_code
+)
 
 logger = logging.getLogger(__name__)
 
 async def show_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        with get_db() as db:
-            user = db.query(User).filter(User.telegram_id == update.effective_user.id).first()
-            if not user:
-                user = User(
-                    telegram_id=update.effective_user.id,
-                    username=update.effective_user.username,
-                    first_name=update.effective_user.first_name,
-                    last_name=update.effective_user.last_name
-                )
-                db.add(user)
-                db.commit()
+        async with get_async_db() as db:
+            user = await get_or_create_user(db, update.effective_user)
             
             settings_text = (
                 i18n.get_text("settings", update.effective_user.language_code) + "\n" +
@@ -42,25 +36,17 @@ async def set_currency(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     currency = context.args[0].upper()
-    supported_currencies = ["USD", "EUR", "GBP", "BRL"]
-    if currency not in supported_currencies:
-        await update.message.reply_text(f"Unsupported currency. Supported: {', '.join(supported_currencies)}")
+    if not validate_currency_code(currency):
+        await update.message.reply_text(f"Unsupported currency. Supported: {', '.join(SUPPORTED_CURRENCIES)}")
         return
     
     try:
-        with get_db() as db:
-            user = db.query(User).filter(User.telegram_id == update.effective_user.id).first()
-            if not user:
-                user = User(
-                    telegram_id=update.effective_user.id,
-                    username=update.effective_user.username,
-                    first_name=update.effective_user.first_name,
-                    last_name=update.effective_user.last_name
-                )
-                db.add(user)
+        async with get_async_db() as db:
+            user = await get_or_create_user(db, update.effective_user)
             
             user.currency = currency
-            db.commit()
+            await db.commit()
+            cache.invalidate_user_stats(update.effective_user.id)
             
             await update.message.reply_text(f"Currency updated to {currency}!")
     
@@ -74,24 +60,16 @@ async def set_language(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     language = context.args[0].lower()
-    if language not in ["en", "pt_br"]:
+    if not validate_language_code(language):
         await update.message.reply_text(i18n.get_text("language_select", update.effective_user.language_code))
         return
     
     try:
-        with get_db() as db:
-            user = db.query(User).filter(User.telegram_id == update.effective_user.id).first()
-            if not user:
-                user = User(
-                    telegram_id=update.effective_user.id,
-                    username=update.effective_user.username,
-                    first_name=update.effective_user.first_name,
-                    last_name=update.effective_user.last_name
-                )
-                db.add(user)
+        async with get_async_db() as db:
+            user = await get_or_create_user(db, update.effective_user)
             
             user.language = language
-            db.commit()
+            await db.commit()
             
             await update.message.reply_text(
                 i18n.get_text("language_updated", language, language=language.upper())
@@ -117,23 +95,15 @@ async def manage_stores(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        with get_db() as db:
-            user = db.query(User).filter(User.telegram_id == update.effective_user.id).first()
-            if not user:
-                user = User(
-                    telegram_id=update.effective_user.id,
-                    username=update.effective_user.username,
-                    first_name=update.effective_user.first_name,
-                    last_name=update.effective_user.last_name
-                )
-                db.add(user)
+        async with get_async_db() as db:
+            user = await get_or_create_user(db, update.effective_user)
             
             stores = user.favorite_stores or []
             if action == "add":
                 if store_name not in stores:
                     stores.append(store_name)
                     user.favorite_stores = stores
-                    db.commit()
+                    await db.commit()
                     await update.message.reply_text(f"Added {store_name} to favorite stores.")
                 else:
                     await update.message.reply_text(f"{store_name} is already in favorite stores.")
@@ -141,7 +111,7 @@ async def manage_stores(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 if store_name in stores:
                     stores.remove(store_name)
                     user.favorite_stores = stores
-                    db.commit()
+                    await db.commit()
                     await update.message.reply_text(f"Removed {store_name} from favorite stores.")
                 else:
                     await update.message.reply_text(f"{store_name} not found in favorite stores.")
@@ -1,15 +1,30 @@
 import re
-from datetime import datetime
+from typing import Optional
 from telegram import Update
 from telegram.ext import ContextTypes
-from app.database import get_db
+from sqlalchemy import select, delete, insert, literal, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from app.core.database import get_async_db
+from app.core.cache import cache
 from app.models import ShoppingList, ShoppingListItem, Product, PriceHistory
 from app.utils import i18n
-from app import settings
+from app.config.settings import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+PRODUCT_ID_CACHE_TTL = 300
+
+_ITEM_RE = re.compile(r"^(.*?)\s*(\d+\.?\d*)\s*(kg|g|l|ml|unit)?$", re.IGNORECASE)
+
+async def get_active_list(db: AsyncSession, user_id: int) -> Optional[ShoppingList]:
+    """The user's active shopping list, if any"""
+    return await db.scalar(select(ShoppingList).where(
+        ShoppingList.user_id == user_id,
+        ShoppingList.is_active == True
+    ))
+
 async def add_to_shopping_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message.text:
         await update.message.reply_text(i18n.get_text("no_text", update.effective_user.language_code))
@@ -23,28 +38,36 @@ async def add_to_shopping_list(update: Update, context: ContextTypes.DEFAULT_TYP
     
     item_name = parsed["name"]
     try:
-        with get_db() as db:
+        async with get_async_db() as db:
             user_id = update.effective_user.id
-            shopping_list = db.query(ShoppingList).filter(
-                ShoppingList.user_id == user_id,
-                ShoppingList.is_active == True
-            ).first()
+            shopping_list = await get_active_list(db, user_id)
             
             if not shopping_list:
                 shopping_list = ShoppingList(user_id=user_id, is_active=True)
                 db.add(shopping_list)
-                db.commit()
+                await db.commit()
             
-            product = db.query(Product).filter(Product.name.ilike(f"%{item_name}%")).first()
-            if not product:
-                product = Product(name=item_name, category="unknown")
-                db.add(product)
-                db.commit()
+            # Name-to-product resolution almost never changes, so skip the lookup on repeat adds.
+            # Exact case-insensitive match, the same key receipt ingest upserts products under.
+            product_id = cache.get_product_id(item_name)
+            if product_id is None:
+                product_id = await db.scalar(
+                    select(Product.id)
+                    .where(func.lower(Product.name) == item_name.strip().lower())
+                    .order_by(Product.id)
+                    .limit(1)
+                )
+                if product_id is None:
+                    product = Product(name=item_name, category="unknown")
+                    db.add(product)
+                    await db.commit()
+                    product_id = product.id
+                cache.cache_product_id(item_name, product_id, PRODUCT_ID_CACHE_TTL)
             
-            existing_item = db.query(ShoppingListItem).filter(
+            existing_item = await db.scalar(select(ShoppingListItem).where(
                 ShoppingListItem.shopping_list_id == shopping_list.id,
-                ShoppingListItem.product_id == product.id
-            ).first()
+                ShoppingListItem.product_id == product_id
+            ))
             
             if existing_item:
                 existing_item.quantity += parsed["quantity"]
@@ -52,21 +75,22 @@ async def add_to_shopping_list(update: Update, context: ContextTypes.DEFAULT_TYP
             else:
                 shopping_list_item = ShoppingListItem(
                     shopping_list_id=shopping_list.id,
-                    product_id=product.id,
+                    product_id=product_id,
                     quantity=parsed["quantity"],
                     unit=parsed["unit"]
                 )
                 db.add(shopping_list_item)
             
-            if settings.enable_price_tracking and product.last_price:
-                price_history = PriceHistory(
-                    product_id=product.id,
-                    price=product.last_price,
-                    currency=context.user_data.get('currency', 'USD')
-                )
-                db.add(price_history)
+            # Record the product's current price server-side instead of loading the row for it
+            if settings.enable_price_tracking:
+                await db.execute(insert(PriceHistory).from_select(
+                    ["product_id", "price", "currency"],
+                    select(Product.id, Product.last_price, literal(context.user_data.get('currency', 'USD')))
+                    .where(Product.id == product_id, Product.last_price.isnot(None), Product.last_price != 0)
+                ))
             
-            db.commit()
+            await db.commit()
+            cache.invalidate_user_suggestions(user_id)
             
             await update.message.reply_text(
                 i18n.get_text("item_added", update.effective_user.language_code).format(item=f"{item_name} ({parsed['quantity']} {parsed['unit']})")
@@ -79,25 +103,23 @@ async def add_to_shopping_list(update: Update, context: ContextTypes.DEFAULT_TYP
 async def remove_from_shopping_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text.replace("/remove", "").strip()
     try:
-        with get_db() as db:
+        async with get_async_db() as db:
             user_id = update.effective_user.id
-            shopping_list = db.query(ShoppingList).filter(
-                ShoppingList.user_id == user_id,
-                ShoppingList.is_active == True
-            ).first()
+            shopping_list = await get_active_list(db, user_id)
             
             if not shopping_list:
                 await update.message.reply_text(i18n.get_text("no_active_list", update.effective_user.language_code))
                 return
             
-            item = db.query(ShoppingListItem).join(Product).filter(
+            item = await db.scalar(select(ShoppingListItem).join(Product).where(
                 ShoppingListItem.shopping_list_id == shopping_list.id,
                 Product.name.ilike(f"%{text}%")
-            ).first()
+            ))
             
             if item:
-                db.delete(item)
-                db.commit()
+                await db.delete(item)
+                await db.commit()
+                cache.invalidate_user_suggestions(user_id)
                 await update.message.reply_text(
                     i18n.get_text("item_removed", update.effective_user.language_code).format(item=text)
                 )
@@ -110,12 +132,13 @@ async def remove_from_shopping_list(update: Update, context: ContextTypes.DEFAUL
 
 async def show_shopping_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        with get_db() as db:
+        async with get_async_db() as db:
             user_id = update.effective_user.id
-            shopping_list = db.query(ShoppingList).filter(
-                ShoppingList.user_id == user_id,
-                ShoppingList.is_active == True
-            ).first()
+            shopping_list = await db.scalar(
+                select(ShoppingList)
+                .options(selectinload(ShoppingList.items).selectinload(ShoppingListItem.product))
+                .where(ShoppingList.user_id == user_id, ShoppingList.is_active == True)
+            )
             
             if not shopping_list or not shopping_list.items:
                 await update.message.reply_text(i18n.get_text("empty_list", update.effective_user.language_code))
@@ -135,22 +158,20 @@ async def show_shopping_list(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def clear_shopping_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        with get_db() as db:
+        async with get_async_db() as db:
             user_id = update.effective_user.id
-            shopping_list = db.query(ShoppingList).filter(
-                ShoppingList.user_id == user_id,
-                ShoppingList.is_active == True
-            ).first()
+            shopping_list = await get_active_list(db, user_id)
             
             if not shopping_list:
                 await update.message.reply_text(i18n.get_text("no_active_list", update.effective_user.language_code))
                 return
             
-            db.query(ShoppingListItem).filter(
+            await db.execute(delete(ShoppingListItem).where(
                 ShoppingListItem.shopping_list_id == shopping_list.id
-            ).delete()
+            ))
             shopping_list.is_active = False
-            db.commit()
+            await db.commit()
+            cache.invalidate_user_suggestions(user_id)
             
             await update.message.reply_text(i18n.get_text("list_cleared", update.effective_user.language_code))
     
@@ -159,8 +180,7 @@ async def clear_shopping_list(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text(i18n.get_text("error_occurred", update.effective_user.language_code))
 
 def parse_item(text: str) -> dict:
-    pattern = r"^(.*?)\s*(\d+\.?\d*)\s*(kg|g|l|ml|unit)?$"
-    match = re.match(pattern, text.strip(), re.IGNORECASE)
+    match = _ITEM_RE.match(text.strip())
     if not match:
         return None
     
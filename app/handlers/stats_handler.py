@@ -1,7 +1,12 @@
+import html
 from telegram import Update
+from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
-from app.database import get_db
-from app.models import Receipt, User
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+from app.core.database import get_async_db
+from app.core.cache import cache
+from app.models import Receipt, ReceiptItem, Product, User
 from app.utils import i18n, format_currency
 import logging
 
@@ -9,38 +14,67 @@ logger = logging.getLogger(__name__)
 
 async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        with get_db() as db:
+        async with get_async_db() as db:
             user_id = update.effective_user.id
-            user = db.query(User).filter(User.telegram_id == user_id).first()
-            currency = user.currency if user else 'USD'
-            receipts = db.query(Receipt).filter(Receipt.user_id == user_id).all()
+            stats = cache.get_user_stats(user_id)
+            if stats is None:
+                # Currency, totals and the category breakdown come back in a single round-trip
+                category_total = func.sum(ReceiptItem.total_price)
+                categories = (
+                    select(Product.category.label("category"), category_total.label("amount"))
+                    .join(ReceiptItem.receipt)
+                    .join(ReceiptItem.product)
+                    .where(Receipt.user_id == user_id, Product.category.isnot(None))
+                    .group_by(Product.category)
+                    .subquery()
+                )
+                category_breakdown = select(func.json_agg(
+                    aggregate_order_by(
+                        func.json_build_array(categories.c.category, categories.c.amount), categories.c.amount.desc()
+                    ),
+                    type_=JSON
+                )).scalar_subquery()
             
-            if not receipts:
+                currency, receipt_count, total_spent, category_spending = (await db.execute(
+                    select(
+                        select(User.currency).where(User.telegram_id == user_id).scalar_subquery(),
+                        func.count(Receipt.id),
+                        func.coalesce(func.sum(Receipt.total_amount), 0.0),
+                        category_breakdown
+                    )
+                    .where(Receipt.user_id == user_id)
+                )).one()
+            
+                stats = {
+                    "currency": currency or 'USD',
+                    "receipt_count": receipt_count,
+                    "total_spent": total_spent,
+                    "category_spending": category_spending or []
+                }
+                cache.cache_user_stats(user_id, stats)
+            
+            currency, receipt_count, total_spent = stats["currency"], stats["receipt_count"], stats["total_spent"]
+            
+            if not receipt_count:
                 await update.message.reply_text("No purchase history available.")
                 return
             
-            total_spent = sum(receipt.total_amount for receipt in receipts if receipt.total_amount)
-            receipt_count = len(receipts)
-            avg_spend = total_spent / receipt_count if receipt_count else 0
-            
-            category_spending = {}
-            for receipt in receipts:
-                for item in receipt.items:
-                    product = item.product
-                    if product and product.category:
-                        category_spending[product.category] = category_spending.get(product.category, 0) + item.total_price
+            avg_spend = total_spent / receipt_count
             
-            stats_text = (
-                "📊 Shopping Analytics\n" +
-                f"Total Receipts: {receipt_count}\n" +
-                f"Total Spent: {format_currency(total_spent, currency)}\n" +
-                f"Average Spend per Receipt: {format_currency(avg_spend, currency)}\n" +
-                "\nCategory Breakdown:\n" +
-                "\n".join(f"{cat}: {format_currency(amount, currency)}" 
-                          for cat, amount in category_spending.items())
+            parts = [
+                "📊 <b>Shopping Analytics</b>",
+                f"Total Receipts: {receipt_count}",
+                f"Total Spent: {format_currency(total_spent, currency)}",
+                f"Average Spend per Receipt: {format_currency(avg_spend, currency)}",
+                "",
+                "<b>Category Breakdown:</b>",
+            ]
+            parts.extend(
+                f"{html.escape(cat)}: {format_currency(amount, currency)}"
+                for cat, amount in stats["category_spending"]
             )
             
-            await update.message.reply_text(stats_text)
+            await update.message.reply_text("\n".join(parts), parse_mode=ParseMode.HTML)
     
     except Exception as e:
         logger.error(f"Error showing stats: {e}")
@@ -1,15 +1,30 @@
 import logging
+from typing import List
 from telegram import Update
 from telegram.ext import ContextTypes
-from app.services.ai_service import AIService
-from app.services.database import get_db
-from app.models import ShoppingList
+from app.services.ai_service import ai_service
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db
+from app.models import Product, ShoppingList, ShoppingListItem, Receipt, ReceiptItem
 from app.services.i18n_service import i18n
 from app.config.settings import settings
 
 logger = logging.getLogger(__name__)
 
-ai_service = AIService()
+FREQUENT_ITEMS_LIMIT = 50
+
+async def get_frequent_items(db: AsyncSession, user_id: int, limit: int = FREQUENT_ITEMS_LIMIT) -> List[str]:
+    """The user's most frequently bought receipt items, most frequent first, ranked in SQL"""
+    item_name = func.lower(ReceiptItem.item_name)
+    return list(await db.scalars(
+        select(item_name)
+        .join(ReceiptItem.receipt)
+        .where(Receipt.user_id == user_id)
+        .group_by(item_name)
+        .order_by(func.count().desc())
+        .limit(limit)
+    ))
 
 async def get_suggestions(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not settings.enable_ai_suggestions or settings.ai_provider == "none":
@@ -17,22 +32,26 @@ async def get_suggestions(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        with get_db() as db:
+        async with get_async_db() as db:
             user_id = update.effective_user.id
-            shopping_list = db.query(ShoppingList).filter(
-                ShoppingList.user_id == user_id,
-                ShoppingList.is_active == True
-            ).first()
+            # Only the product names feed the prompt, so read them as plain rows rather than ORM graphs
+            items = list(await db.scalars(
+                select(Product.name)
+                .select_from(ShoppingListItem)
+                .join(ShoppingListItem.product)
+                .join(ShoppingListItem.shopping_list)
+                .where(ShoppingList.user_id == user_id, ShoppingList.is_active == True)
+            ))
             
-            items = []
-            if shopping_list:
-                items = [item.product.name for item in shopping_list.items]
+            # With an empty list, suggest from what the user usually buys
+            if not items:
+                items = await get_frequent_items(db, user_id)
             
             if not items:
                 await update.message.reply_text(i18n.get_text("no_suggestions_data", update.effective_user.language_code))
                 return
             
-            suggestions = await ai_service.generate_suggestions(items)
+            suggestions = await ai_service.get_user_suggestions(user_id, items)
             if suggestions:
                 await update.message.reply_text(
                     i18n.get_text("ai_suggestions_title", update.effective_user.language_code, provider="") +
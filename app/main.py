@@ -4,22 +4,28 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import threading
 import schedule
 import time
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
 from app.handlers.shopping_handler import add_to_shopping_list, remove_from_shopping_list, show_shopping_list, clear_shopping_list
 from app.handlers.settings_handler import set_currency, set_language, manage_stores, show_settings
 from app.handlers.stats_handler import show_stats
 from app.handlers.suggestion_handler import get_suggestions
 from app.handlers.receipt_handler import process_receipt
-from app.core.database import create_tables
-from app.services.notification_service import NotificationService
+from app.core.database import create_tables, ensure_price_history_partitions, ensure_price_history_partitions_job, warm_async_pool
+from app.services.notification_service import notification_service
+from app.services.ocr_service import ocr_service
 from app.utils import i18n
 from app.config.settings import settings
 import logging
 from aiohttp import web
 import asyncio 
 
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
 logger = logging.getLogger(__name__)
-notification_service = NotificationService()
 
 async def health_check(request):
     return web.Response(text="OK", status=200)
@@ -38,45 +44,63 @@ def run_health_server():
     site = web.TCPSite(runner, '0.0.0.0', 8080)
     loop.run_until_complete(site.start())
 
+# Static layout of /start and /help; only the translated strings are looked up per call
+START_SECTIONS = (
+    ("features_title", "feature_lists", "feature_receipts", "feature_ai", "feature_tracking", "feature_stores"),
+    ("quick_start", "cmd_add", "cmd_list", "cmd_suggestions", "cmd_receipt", "cmd_stats", "ready_message"),
+)
+HELP_COMMANDS = (
+    ("cmd_add", " - Add items (e.g., '/add milk 2L')"),
+    ("cmd_list", " - View shopping list"),
+    ("cmd_suggestions", " - Get AI recommendations"),
+    ("cmd_receipt", " - Process receipt photo"),
+    ("cmd_stats", " - View shopping analytics"),
+    ("cmd_settings", " - Configure preferences"),
+    ("cmd_currency", " - Set currency"),
+    ("cmd_language", " - Set language"),
+    ("cmd_stores", " - Manage favorite stores"),
+    ("cmd_clear", " - Clear shopping list"),
+)
+
+async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    language = update.effective_user.language_code
+    sections = [i18n.get_text("welcome_message", language, name=update.effective_user.first_name)]
+    sections.extend("\n".join(i18n.get_text(key, language) for key in keys) for keys in START_SECTIONS)
+    await update.message.reply_text("\n\n".join(sections))
+
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    language = update.effective_user.language_code
+    await update.message.reply_text("Commands:\n" + "\n".join(
+        i18n.get_text(key, language) + description for key, description in HELP_COMMANDS
+    ))
+
+async def post_init(application: Application):
+    await notification_service.post_init(application)
+    await warm_async_pool()
+
+async def post_shutdown(application: Application):
+    ocr_service.shutdown()
+
 def main():
+    # uvloop's C event loop speeds up every await in the update pipeline
+    if uvloop is not None:
+        uvloop.install()
+    
     create_tables()
+    ensure_price_history_partitions()
     
-    application = Application.builder().token(settings.telegram_token).build()
+    application = Application.builder().token(settings.telegram_token).post_init(post_init).post_shutdown(post_shutdown).build()
     
     notification_service.set_application(application)
     
+    schedule.every().day.at("00:00").do(ensure_price_history_partitions_job)
+    schedule.every(5).minutes.do(i18n.load_translations)
+    
     if settings.enable_notifications:
-        schedule.every().day.at("08:00").do(notification_service.send_daily_notifications)
+        schedule.every().day.at("08:00").do(notification_service.run_on_bot_loop, notification_service.send_daily_notifications)
     
-    application.add_handler(CommandHandler("start", lambda update, context: update.message.reply_text(
-        i18n.get_text("welcome_message", update.effective_user.language_code, name=update.effective_user.first_name) +
-        "\n\n" + i18n.get_text("features_title", update.effective_user.language_code) +
-        "\n" + i18n.get_text("feature_lists", update.effective_user.language_code) +
-        "\n" + i18n.get_text("feature_receipts", update.effective_user.language_code) +
-        "\n" + i18n.get_text("feature_ai", update.effective_user.language_code) +
-        "\n" + i18n.get_text("feature_tracking", update.effective_user.language_code) +
-        "\n" + i18n.get_text("feature_stores", update.effective_user.language_code) +
-        "\n\n" + i18n.get_text("quick_start", update.effective_user.language_code) +
-        "\n" + i18n.get_text("cmd_add", update.effective_user.language_code) +
-        "\n" + i18n.get_text("cmd_list", update.effective_user.language_code) +
-        "\n" + i18n.get_text("cmd_suggestions", update.effective_user.language_code) +
-        "\n" + i18n.get_text("cmd_receipt", update.effective_user.language_code) +
-        "\n" + i18n.get_text("cmd_stats", update.effective_user.language_code) +
-        "\n" + i18n.get_text("ready_message", update.effective_user.language_code)
-    )))
-    application.add_handler(CommandHandler("help", lambda update, context: update.message.reply_text(
-        "Commands:\n" +
-        i18n.get_text("cmd_add", update.effective_user.language_code) + " - Add items (e.g., '/add milk 2L')\n" +
-        i18n.get_text("cmd_list", update.effective_user.language_code) + " - View shopping list\n" +
-        i18n.get_text("cmd_suggestions", update.effective_user.language_code) + " - Get AI recommendations\n" +
-        i18n.get_text("cmd_receipt", update.effective_user.language_code) + " - Process receipt photo\n" +
-        i18n.get_text("cmd_stats", update.effective_user.language_code) + " - View shopping analytics\n" +
-        i18n.get_text("cmd_settings", update.effective_user.language_code) + " - Configure preferences\n" +
-        i18n.get_text("cmd_currency", update.effective_user.language_code) + " - Set currency\n" +
-        i18n.get_text("cmd_language", update.effective_user.language_code) + " - Set language\n" +
-        i18n.get_text("cmd_stores", update.effective_user.language_code) + " - Manage favorite stores\n" +
-        i18n.get_text("cmd_clear", update.effective_user.language_code) + " - Clear shopping list"
-    )))
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("add", add_to_shopping_list))
     application.add_handler(CommandHandler("remove", remove_from_shopping_list))
     application.add_handler(CommandHandler("list", show_shopping_list))
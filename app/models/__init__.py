@@ -0,0 +1 @@
+from app.models.product import Base, User, Product, ShoppingList, ShoppingListItem, Receipt, ReceiptItem, PriceHistory
@@ -1,16 +1,16 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, JSON, Text
-from sqlalchemy.orm import relationship
-from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, JSON, Text, Index, func
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
 class User(Base):
     __tablename__ = "users"
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True, index=True)
     telegram_id = Column(Integer, unique=True, index=True, nullable=False)
-    username = Column(String, nullable=True)
+    username = Column(String, index=True, nullable=True)
     first_name = Column(String, nullable=True)
     last_name = Column(String, nullable=True)
     language = Column(String, default="en")
@@ -21,9 +21,9 @@ class User(Base):
     budget_limit = Column(Float, nullable=True)
     ai_suggestions_enabled = Column(Boolean, default=True)
     price_alerts_enabled = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    last_active = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    last_active = Column(DateTime, server_default=func.now())
     
     shopping_lists = relationship("ShoppingList", back_populates="user")
     receipts = relationship("Receipt", back_populates="user")
@@ -32,24 +32,28 @@ class Product(Base):
     __tablename__ = "products"
     
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
+    name = Column(String)
+    brand = Column(String, nullable=False, default="", server_default="")
     category = Column(String, nullable=True)
     last_price = Column(Float, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
     shopping_list_items = relationship("ShoppingListItem", back_populates="product")
     receipt_items = relationship("ReceiptItem", back_populates="product")
     price_history = relationship("PriceHistory", back_populates="product")
 
+# Names are unique per brand regardless of case, matching how receipts and /add resolve products
+Index("uq_products_lower_name_brand", func.lower(Product.name), Product.brand, unique=True)
+
 class ShoppingList(Base):
     __tablename__ = "shopping_lists"
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.telegram_id"))
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
     user = relationship("User", back_populates="shopping_lists")
     items = relationship("ShoppingListItem", back_populates="shopping_list")
@@ -62,14 +66,15 @@ class ShoppingListItem(Base):
     product_id = Column(Integer, ForeignKey("products.id"))
     quantity = Column(Float)
     unit = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
     shopping_list = relationship("ShoppingList", back_populates="items")
     product = relationship("Product", back_populates="shopping_list_items")
 
 class Receipt(Base):
     __tablename__ = "receipts"
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.telegram_id"), nullable=False)
@@ -81,9 +86,9 @@ class Receipt(Base):
     currency = Column(String, default="USD")
     ocr_confidence = Column(Float, nullable=True)
     processing_status = Column(String, default="pending")
-    raw_text = Column(Text, nullable=True)
+    raw_text = deferred(Column(Text, nullable=True), group="raw")
     purchase_date = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.now())
     processed_at = Column(DateTime, nullable=True)
     
     user = relationship("User", back_populates="receipts")
@@ -95,4 +100,26 @@ class ReceiptItem(Base):
     id = Column(Integer, primary_key=True, index=True)
     receipt_id = Column(Integer, ForeignKey("receipts.id"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=True)
-    item_name = Column
\ No newline at end of file
+    item_name = Column(String, nullable=False)
+    quantity = Column(Float, default=1.0)
+    unit_price = Column(Float, nullable=True)
+    total_price = Column(Float, nullable=True)
+    confidence_score = Column(Float, nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    
+    receipt = relationship("Receipt", back_populates="items")
+    product = relationship("Product", back_populates="receipt_items")
+
+class PriceHistory(Base):
+    __tablename__ = "price_history"
+    # Monthly range partitions are created by ensure_price_history_partitions()
+    __table_args__ = {"postgresql_partition_by": "RANGE (recorded_at)"}
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    price = Column(Float, nullable=False)
+    currency = Column(String, default="USD")
+    recorded_at = Column(DateTime, primary_key=True, nullable=False, server_default=func.now())
+    
+    product = relationship("Product", back_populates="price_history")
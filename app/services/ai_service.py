@@ -1,24 +1,125 @@
+import asyncio
+import hashlib
 import logging
-from typing import List
-from openai import OpenAI
+import re
+import weakref
+from functools import lru_cache
+from typing import Dict, List, Optional
+from openai import AsyncOpenAI
 from google.cloud import vision
-from app import settings
-from ratelimit import limits, sleep_and_retry
+from app.config.settings import settings
+from app.core.cache import cache
+from app.services.rate_limiter import AsyncTokenBucket
+from app.utils.helpers import chunk_list, parse_receipt_date
 import aiohttp
+import httpx
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# Currency symbol followed by an amount, e.g. "$3.49" or "€2,50"
+_PRICE_TOKEN_RE = re.compile(r"[$€£]\s*(\d+(?:[.,]\d{1,2})?)")
+
+# Receipt header lines naming the shop, matched without lowercasing each line
+_STORE_NAME_RE = re.compile(r"store|mart", re.IGNORECASE)
+
+# Caps in-flight provider requests across every AIService instance
+_ai_semaphore = asyncio.Semaphore(settings.ai_max_concurrency)
+
+# Shared RPM/TPM budget so bursts wait client-side instead of hitting 429 back-off
+_ai_rate_limiter = AsyncTokenBucket(settings.ai_rpm, settings.ai_tpm)
+
+SUGGESTION_MAX_TOKENS = 100
+
+@lru_cache(maxsize=1)
+def _get_openai_client() -> AsyncOpenAI:
+    """One AsyncOpenAI client and keep-alive connection pool shared by every AIService"""
+    http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=100, max_keepalive_connections=50))
+    return AsyncOpenAI(api_key=settings.openai_api_key, http_client=http_client)
+
+# Identical item baskets share one cached provider response across users
+PROMPT_CACHE_TTL = 86400
+
+def _normalize_items(items: List[str]) -> List[str]:
+    """Lower-case, de-duplicate and sort items so equivalent baskets produce the same prompt"""
+    return sorted({item.strip().lower() for item in items if item.strip()})
+
+def _prompt_cache_key(service: "AIService", items: List[str]) -> str:
+    """Content-addressed cache key for a suggestion prompt"""
+    canonical = orjson.dumps(
+        {"provider": service.ai_provider, "model": service.ai_model, "items": _normalize_items(items)},
+        option=orjson.OPT_SORT_KEYS
+    )
+    return f"ai:sugg:{hashlib.blake2b(canonical, digest_size=16).hexdigest()}"
+
+# Empty results are cached briefly so a failing provider is not hammered, but retried soon
+EMPTY_SUGGESTIONS_TTL = 300
+
+# Static system messages, built once and sent as an identical prefix so providers can cache it
+SUGGESTION_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are a smart shopping assistant. Given the items a user is buying, "
+               "suggest additional shopping items they are likely to need."
+}
+
+BATCH_SUGGESTION_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are a smart shopping assistant. You receive a JSON array of users, each with a uid and "
+               "their shopping data. For each user, suggest additional shopping items they are likely to need."
+}
+
+# Structured-output schemas, so responses arrive as schema-valid JSON without format instructions in the prompt
+SUGGESTIONS_SCHEMA = {
+    "type": "object",
+    "properties": {"suggestions": {"type": "array", "items": {"type": "string"}}},
+    "required": ["suggestions"],
+    "additionalProperties": False
+}
+
+BATCH_SUGGESTIONS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "uid": {"type": "integer"},
+                    "suggestions": {"type": "array", "items": {"type": "string"}}
+                },
+                "required": ["uid", "suggestions"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["results"],
+    "additionalProperties": False
+}
+
+def _gemini_schema(schema: dict) -> dict:
+    """Convert a JSON schema to Gemini's OpenAPI subset (upper-case types, no additionalProperties)"""
+    converted = {"type": schema["type"].upper()}
+    if "properties" in schema:
+        converted["properties"] = {name: _gemini_schema(prop) for name, prop in schema["properties"].items()}
+    if "items" in schema:
+        converted["items"] = _gemini_schema(schema["items"])
+    if "required" in schema:
+        converted["required"] = schema["required"]
+    return converted
+
 class AIService:
     def __init__(self):
         self.ai_provider = settings.get_active_ai_provider()
         self.ai_model = settings.get_ai_model()
         self.client = None
         self.session = None
+        # Held only by in-flight refills, so a user's lock disappears once nobody is waiting on it
+        self._suggestion_locks = weakref.WeakValueDictionary()
         
         if self.ai_provider == "openai" and settings.openai_api_key:
-            self.client = OpenAI(api_key=settings.openai_api_key)
+            self.client = _get_openai_client()
         elif self.ai_provider == "gemini" and settings.gemini_api_key:
-            self.session = aiohttp.ClientSession()
+            self.session = aiohttp.ClientSession(json_serialize=lambda o: orjson.dumps(o).decode())
         elif self.ai_provider == "none":
             logger.warning("No AI provider configured")
         
@@ -28,45 +129,128 @@ class AIService:
                 settings.google_vision_api_key
             )
 
-    @sleep_and_retry
-    @limits(calls=10, period=60)
-    async def generate_suggestions(self, items: list[str]) -> list[str]:
-        if self.ai_provider == "none":
-            logger.warning("AI suggestions disabled")
-            return []
-        
-        try:
+    async def _complete(self, system_message: dict, prompt: str, max_tokens: int, schema_name: str, schema: dict) -> dict:
+        """Send one prompt to the active provider and return its schema-constrained JSON response"""
+        async with _ai_semaphore:
+            # Rough estimate of ~4 characters per token plus the completion budget
+            await _ai_rate_limiter.acquire(
+                estimated_tokens=(len(system_message["content"]) + len(prompt)) // 4 + max_tokens
+            )
             if self.ai_provider == "openai":
-                prompt = f"Based on these items: {', '.join(items)}, suggest additional shopping items."
-                response = self.client.chat.completions.create(
+                response = await self.client.chat.completions.create(
                     model=self.ai_model,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=100
+                    messages=[system_message, {"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    response_format={
+                        "type": "json_schema",
+                        "json_schema": {"name": schema_name, "schema": schema, "strict": True}
+                    }
                 )
-                suggestions = response.choices[0].message.content.split(", ")
-                logger.info(f"Generated suggestions: {suggestions}")
-                return suggestions
+                content = response.choices[0].message.content
+                return orjson.loads(content) if content else {}
             elif self.ai_provider == "gemini":
                 # Hypothetical Gemini API endpoint and structure
                 async with self.session.post(
-                    "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent",  # Example endpoint
+                    f"https://generativelanguage.googleapis.com/v1beta/models/{self.ai_model}:generateContent",
                     headers={"x-goog-api-key": settings.gemini_api_key},
                     json={
-                        "contents": [{"parts": [{"text": f"Based on these items: {', '.join(items)}, suggest additional shopping items."}]}],
-                        "generationConfig": {"maxOutputTokens": 100}
+                        "systemInstruction": {"parts": [{"text": system_message["content"]}]},
+                        "contents": [{"parts": [{"text": prompt}]}],
+                        "generationConfig": {
+                            "maxOutputTokens": max_tokens,
+                            "responseMimeType": "application/json",
+                            "responseSchema": _gemini_schema(schema)
+                        }
                     }
                 ) as response:
                     if response.status == 200:
-                        data = await response.json()
-                        suggestions = data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "").split(", ")
-                        logger.info(f"Generated suggestions: {suggestions}")
-                        return suggestions
-                    else:
-                        logger.error(f"Gemini API error: {response.status} - {await response.text()}")
-                        return []
+                        data = orjson.loads(await response.read())
+                        text = data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+                        return orjson.loads(text) if text else {}
+                    logger.error(f"Gemini API error: {response.status} - {await response.text()}")
+        return {}
+
+    async def generate_suggestions(self, items: list[str]) -> list[str]:
+        if self.ai_provider == "none":
+            logger.warning("AI suggestions disabled")
+            return []
+        
+        return await self._fetch_suggestions(items) or []
+
+    @cache.memoize(key=_prompt_cache_key, ttl=PROMPT_CACHE_TTL)
+    async def _fetch_suggestions(self, items: List[str]) -> Optional[List[str]]:
+        """Call the provider for a basket; None (not cached) when nothing usable came back"""
+        try:
+            prompt = f"Items: {', '.join(_normalize_items(items))}"
+            data = await self._complete(
+                SUGGESTION_SYSTEM_MESSAGE, prompt, SUGGESTION_MAX_TOKENS, "shopping_suggestions", SUGGESTIONS_SCHEMA
+            )
+            suggestions = data.get("suggestions", [])
+            logger.info(f"Generated suggestions: {suggestions}")
+            return suggestions or None
         except Exception as e:
             logger.error(f"Failed to generate suggestions: {e}")
-            return []
+            return None
+
+    async def get_user_suggestions(self, user_id: int, items: List[str]) -> List[str]:
+        """Cached suggestions for a user; concurrent misses for one user share a single provider call"""
+        suggestions = cache.get_user_suggestions(user_id)
+        if suggestions is not None:
+            return suggestions
+        
+        lock = self._suggestion_locks.get(user_id)
+        if lock is None:
+            lock = self._suggestion_locks[user_id] = asyncio.Lock()
+        async with lock:
+            suggestions = cache.get_user_suggestions(user_id)
+            if suggestions is None:
+                suggestions = await self.generate_suggestions(items)
+                if suggestions:
+                    cache.cache_user_suggestions(user_id, suggestions)
+                else:
+                    cache.cache_user_suggestions(user_id, suggestions, ttl=EMPTY_SUGGESTIONS_TTL)
+        return suggestions
+
+    async def generate_suggestions_batch(self, user_contexts: List[dict]) -> Dict[int, List[str]]:
+        """Generate suggestions for many users, packing several users into each provider call.
+        
+        Each context is a dict with a "uid" key plus whatever the prompt should see
+        (e.g. "items", "prefs"). Returns suggestions keyed by uid.
+        """
+        if self.ai_provider == "none" or not user_contexts:
+            return {}
+        
+        results = {}
+        batches = chunk_list(user_contexts, settings.ai_batch_size)
+        for batch_result in await asyncio.gather(*(self._generate_batch(batch) for batch in batches)):
+            results.update(batch_result)
+        return results
+
+    async def _generate_batch(self, batch: List[dict]) -> Dict[int, List[str]]:
+        """Run one batched prompt, halving the batch while it exceeds the token limit"""
+        prompt = orjson.dumps(batch).decode()
+        max_tokens = SUGGESTION_MAX_TOKENS * len(batch)
+        prompt_tokens = (len(BATCH_SUGGESTION_SYSTEM_MESSAGE["content"]) + len(prompt)) // 4
+        if len(batch) > 1 and prompt_tokens + max_tokens > settings.ai_batch_token_limit:
+            middle = len(batch) // 2
+            first, second = await asyncio.gather(
+                self._generate_batch(batch[:middle]), self._generate_batch(batch[middle:])
+            )
+            return {**first, **second}
+        
+        try:
+            data = await self._complete(
+                BATCH_SUGGESTION_SYSTEM_MESSAGE, prompt, max_tokens, "batch_shopping_suggestions", BATCH_SUGGESTIONS_SCHEMA
+            )
+            uids = {context["uid"] for context in batch}
+            return {
+                result["uid"]: result["suggestions"]
+                for result in data.get("results", [])
+                if result["uid"] in uids
+            }
+        except Exception as e:
+            logger.error(f"Failed to generate batch suggestions: {e}")
+            return {}
 
     def extract_text_from_receipt(self, image_data: bytes) -> dict:
         if not self.vision_client:
@@ -87,32 +271,22 @@ class AIService:
             lines = text.split("\n")
             for line in lines:
                 line = line.strip()
-                if "$" in line or "€" in line or "£" in line:
-                    parts = line.split()
-                    for i, part in enumerate(parts):
-                        if part.startswith(("$", "€", "£")):
-                            try:
-                                price = float(part[1:])
-                                item_name = " ".join(parts[:i]) if i > 0 else "Unknown Item"
-                                items.append({
-                                    "name": item_name,
-                                    "quantity": 1.0,
-                                    "unit_price": price,
-                                    "total_price": price,
-                                    "confidence": confidence
-                                })
-                                total += price
-                            except ValueError:
-                                continue
+                for match in _PRICE_TOKEN_RE.finditer(line):
+                    price = float(match.group(1).replace(",", "."))
+                    item_name = line[:match.start()].strip() or "Unknown Item"
+                    items.append({
+                        "name": item_name,
+                        "quantity": 1.0,
+                        "unit_price": price,
+                        "total_price": price,
+                        "confidence": confidence
+                    })
+                    total += price
                 
-                if "store" in line.lower() or "mart" in line.lower():
+                if _STORE_NAME_RE.search(line):
                     store_name = line
                 if "/" in line or "-" in line:
-                    try:
-                        from dateutil.parser import parse
-                        date = parse(line, fuzzy=True)
-                    except:
-                        continue
+                    date = parse_receipt_date(line) or date
             
             return {
                 "items": items,
@@ -130,18 +304,19 @@ class AIService:
         if self.session:
             await self.session.close()
 
-    def test_connection(self):
+    async def test_connection(self):
         if self.ai_provider == "openai" and self.client:
-            self.client.models.list()
+            await _ai_rate_limiter.acquire()
+            await self.client.models.list()
         elif self.ai_provider == "gemini" and self.session:
-            async def test_gemini():
-                async with self.session.get(
-                    "https://generativelanguage.googleapis.com/v1beta/models",  # Example endpoint
-                    headers={"x-goog-api-key": settings.gemini_api_key}
-                ) as response:
-                    if response.status != 200:
-                        raise Exception("Gemini connection failed")
-            import asyncio
-            asyncio.run(test_gemini())
+            await _ai_rate_limiter.acquire()
+            async with self.session.get(
+                "https://generativelanguage.googleapis.com/v1beta/models",  # Example endpoint
+                headers={"x-goog-api-key": settings.gemini_api_key}
+            ) as response:
+                if response.status != 200:
+                    raise Exception("Gemini connection failed")
         elif self.vision_client:
-            self.vision_client.text_detection(image=vision.Image(content=b""))
\ No newline at end of file
+            self.vision_client.text_detection(image=vision.Image(content=b""))
+
+ai_service = AIService()
\ No newline at end of file
@@ -1,44 +1,98 @@
-import json
 import os
-from typing import Dict, Optional
+from functools import lru_cache
+from string import Formatter
+from typing import Dict, Optional, Tuple
+import orjson
 from app.config.settings import settings
 
+_formatter = Formatter()
+
+def _compile_template(text: str) -> Optional[Tuple]:
+    """Pre-parse a format string into (literal, field, spec, conversion) segments"""
+    try:
+        return tuple(_formatter.parse(text))
+    except ValueError:
+        return None
+
+def _render_template(text: str, segments: Optional[Tuple], kwargs: Dict) -> str:
+    """Render pre-parsed segments, returning the raw text if any field is missing"""
+    if not segments:
+        return text
+    parts = []
+    for literal, field, spec, conversion in segments:
+        parts.append(literal)
+        if field is None:
+            continue
+        if field not in kwargs:
+            return text
+        value = kwargs[field]
+        if conversion == "r":
+            value = repr(value)
+        elif conversion == "a":
+            value = ascii(value)
+        parts.append(format(value, spec) if spec else str(value))
+    return "".join(parts)
+
 class I18nService:
     def __init__(self):
         self.translations = {}
-        self.load_translations()
+        self.templates = {}
+        self._mtimes = {}
+        self._translations_dir = os.path.join(os.path.dirname(__file__), '..', 'translations')
+        self._supported_languages = frozenset(settings.supported_languages)
+        self._lookup = lru_cache(maxsize=4096)(self._lookup_uncached)
+    
+    def _translation_file(self, lang: str) -> str:
+        return os.path.join(self._translations_dir, f'{lang}.json')
+    
+    def _load_language(self, lang: str):
+        """Load a single language's translation file and pre-parse its templates"""
+        translation_file = self._translation_file(lang)
+        if os.path.exists(translation_file):
+            self._mtimes[lang] = os.path.getmtime(translation_file)
+            with open(translation_file, 'rb') as f:
+                translations = orjson.loads(f.read())
+        else:
+            self._mtimes[lang] = None
+            translations = {}
+        
+        self.templates[lang] = {key: _compile_template(text) for key, text in translations.items()}
+        self.translations[lang] = translations
     
     def load_translations(self):
-        """Load translation files"""
-        translations_dir = os.path.join(os.path.dirname(__file__), '..', 'translations')
+        """Reload the already-loaded languages whose translation files changed on disk"""
+        changed = False
+        for lang in list(self.translations):
+            translation_file = self._translation_file(lang)
+            mtime = os.path.getmtime(translation_file) if os.path.exists(translation_file) else None
+            if mtime != self._mtimes.get(lang):
+                self._load_language(lang)
+                changed = True
         
-        for lang in settings.supported_languages:
-            translation_file = os.path.join(translations_dir, f'{lang}.json')
-            if os.path.exists(translation_file):
-                with open(translation_file, 'r', encoding='utf-8') as f:
-                    self.translations[lang] = json.load(f)
-            else:
-                self.translations[lang] = {}
+        if changed:
+            self._lookup.cache_clear()
+    
+    def _lookup_uncached(self, key: str, language: str) -> Tuple[str, Optional[Tuple]]:
+        """Resolve the raw text and parsed template for a key, loading the language on first use"""
+        if language not in self._supported_languages:
+            language = "en"
+        if language not in self.translations:
+            self._load_language(language)
+        return self.translations[language].get(key, key), self.templates[language].get(key)
     
     def get_text(self, key: str, language: str = "en", **kwargs) -> str:
         """Get translated text"""
-        if language not in self.translations:
-            language = "en"
-        
-        text = self.translations[language].get(key, key)
+        text, segments = self._lookup(key, language)
         
         # Format with provided arguments
         if kwargs:
-            try:
-                text = text.format(**kwargs)
-            except (KeyError, ValueError):
-                pass
+            text = _render_template(text, segments, kwargs)
         
         return text
     
     def get_user_language(self, user_language: Optional[str]) -> str:
         """Get user's preferred language or default"""
-        if user_language and user_language in settings.supported_languages:
+        if user_language and user_language in self._supported_languages:
             return user_language
         return settings.default_language
 
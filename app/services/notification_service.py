@@ -1,33 +1,82 @@
+import asyncio
+import html
 import logging
+from collections import defaultdict
+from typing import Optional
+from sqlalchemy import select
+from telegram.constants import ParseMode
+from telegram.error import RetryAfter
 from telegram.ext import Application
-from app.services.database import get_db
-from app.models import ShoppingList
+from app.core.database import get_async_db
+from app.models import Product, ShoppingList, ShoppingListItem
 
 logger = logging.getLogger(__name__)
 
+# Telegram allows roughly 30 messages per second per bot
+_send_semaphore = asyncio.Semaphore(30)
+
 class NotificationService:
     def __init__(self):
         self.application = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
     
     def set_application(self, application: Application):
         self.application = application
     
-    async def send_notification(self, chat_id: int, message: str):
-        if self.application:
-            await self.application.bot.send_message(chat_id=chat_id, text=message)
-            logger.info(f"Notification sent to chat_id {chat_id}: {message}")
+    async def post_init(self, application: Application):
+        """Remember the bot's event loop so scheduler jobs can submit coroutines to it"""
+        self.loop = asyncio.get_running_loop()
+    
+    def run_on_bot_loop(self, coro_func):
+        """Scheduler job wrapper running an async notification job on the bot's loop"""
+        if self.loop:
+            asyncio.run_coroutine_threadsafe(coro_func(), self.loop)
         else:
+            logger.error("Cannot run notification job: bot event loop not started")
+    
+    async def send_notification(self, chat_id: int, message: str, max_attempts: int = 3, parse_mode: Optional[str] = None):
+        if not self.application:
             logger.error("Application not set for NotificationService")
+            return
+        
+        for attempt in range(max_attempts):
+            try:
+                async with _send_semaphore:
+                    await self.application.bot.send_message(chat_id=chat_id, text=message, parse_mode=parse_mode)
+                logger.info(f"Notification sent to chat_id {chat_id}: {message}")
+                return
+            except RetryAfter as e:
+                # Wait outside the semaphore so other sends keep flowing meanwhile
+                logger.warning(f"Rate limited sending to chat_id {chat_id}, retrying in {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+        logger.error(f"Giving up on notification to chat_id {chat_id} after {max_attempts} attempts")
     
-    def send_daily_notifications(self):
-        with get_db() as db:
-            active_lists = db.query(ShoppingList).filter(ShoppingList.is_active == True).all()
-            for shopping_list in active_lists:
-                user_id = shopping_list.user_id
-                items = [item.product.name for item in shopping_list.items]
-                if items:
-                    message = f"Reminder: Your active shopping list contains: {', '.join(items)}"
-                    if self.application:
-                        self.application.create_task(self.send_notification(user_id, message))
-                    else:
-                        logger.error("Cannot send notification: Application not set")
\ No newline at end of file
+    async def send_daily_notifications(self):
+        # Stream just (user, item name) pairs through a server-side cursor instead of loading ORM graphs
+        item_names = defaultdict(list)
+        async with get_async_db() as db:
+            rows = await db.stream(
+                select(ShoppingList.user_id, Product.name)
+                .join(ShoppingList.items)
+                .join(ShoppingListItem.product)
+                .where(ShoppingList.is_active == True)
+                .order_by(ShoppingListItem.id)
+                .execution_options(yield_per=500)
+            )
+            async for user_id, name in rows:
+                item_names[user_id].append(html.escape(name))
+        
+        reminders = {
+            user_id: "<b>Reminder:</b> Your active shopping list contains: " + ", ".join(items)
+            for user_id, items in item_names.items()
+        }
+        
+        results = await asyncio.gather(
+            *(self.send_notification(user_id, message, parse_mode=ParseMode.HTML) for user_id, message in reminders.items()),
+            return_exceptions=True
+        )
+        for user_id, result in zip(reminders, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to send daily notification to {user_id}: {result}")
+
+notification_service = NotificationService()
@@ -1,91 +1,249 @@
 import pytesseract
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image
 import cv2
 import numpy as np
 from typing import Dict, List, Optional, Tuple
 import re
+import hashlib
 import logging
+import asyncio
+import threading
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 
 from app.config.settings import settings
+from app.core.cache import cache
+from app.services.ocr_kernels import sauvola_threshold
+
+try:
+    import tesserocr
+except ImportError:  # fall back to the pytesseract subprocess
+    tesserocr = None
 
 logger = logging.getLogger(__name__)
 
+MAX_IMAGE_EDGE = 2000
+TESSERACT_WHITELIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,$/€£¥ '
+# Column order of Tesseract's TSV output, as returned by pytesseract.image_to_data
+TSV_COLUMNS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text')
+# Substring match on purpose so compounds such as "Gesamtbetrag" or "Subtotal" still count
+TOTAL_KEYWORD_RE = re.compile(r'total|sum|amount|gesamt|suma', re.IGNORECASE)
+PRICE_RE = re.compile(r'\$?(\d+[.,]\d{2})')
+DIGIT_RE = re.compile(r'\d')
+# "Name 1.99" and "Name 2 x 1.99 = 3.98" in one anchored pattern, so each line is matched once
+ITEM_LINE_RE = re.compile(
+    r'^(?P<name>[A-Za-z\s]+)\s+'
+    r'(?:(?P<price>\d+[.,]\d{2})'
+    r'|(?P<quantity>\d+)\s*x\s*(?P<unit_price>\d+[.,]\d{2})\s*=?\s*(?P<total_price>\d+[.,]\d{2}))$'
+)
+DATE_RES = (
+    re.compile(r'(\d{1,2}[./]\d{1,2}[./]\d{2,4})'),
+    re.compile(r'(\d{2,4}[-]\d{1,2}[-]\d{1,2})'),
+)
+
 class OCRService:
     def __init__(self):
         if settings.tesseract_path:
             pytesseract.pytesseract.tesseract_cmd = settings.tesseract_path
         
-        self.price_pattern = re.compile(r'\$?(\d+[.,]\d{2})')
-        self.item_patterns = [
-            re.compile(r'^([A-Za-z\s]+)\s+(\d+[.,]\d{2})$'),
-            re.compile(r'^([A-Za-z\s]+)\s+(\d+)\s*x\s*(\d+[.,]\d{2})\s*=?\s*(\d+[.,]\d{2})$'),
-        ]
+        self.threshold_mode = settings.ocr_threshold_mode
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.tesseract_config = f'--oem 3 --psm 6 -c tessedit_char_whitelist={TESSERACT_WHITELIST}'
+        # libtesseract handle kept for the life of the service, created on first use
+        self._tess_api = None
+        self._tess_lock = threading.Lock()
+        self._use_tesserocr = tesserocr is not None
+        # Parsing is a pure function of the recognised text, so retried or duplicate photos skip the regex work
+        self._parse_text = lru_cache(maxsize=256)(self._parse_receipt_text)
     
-    def preprocess_image(self, image_data: bytes) -> Image.Image:
-        """Enhanced image preprocessing for better OCR accuracy"""
+    def preprocess_image(self, image_data: bytes) -> np.ndarray:
+        """Enhanced image preprocessing for better OCR accuracy, as a single-channel uint8 array"""
         try:
-            image = Image.open(BytesIO(image_data))
+            # Tesseract only needs luminance, so decode straight to grayscale and stay single-channel throughout
+            gray = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                # Formats OpenCV cannot decode still go through PIL
+                gray = np.asarray(Image.open(BytesIO(image_data)).convert('L'))
             
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            # Tesseract gains nothing beyond ~300 DPI, so cap the long edge before the per-pixel filters
+            height, width = gray.shape
+            long_edge = max(height, width)
+            if long_edge > MAX_IMAGE_EDGE:
+                scale = MAX_IMAGE_EDGE / long_edge
+                gray = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
             
-            cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-            cv_image = self._enhance_image(cv_image)
-            processed_image = Image.fromarray(cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB))
-            
-            return processed_image
+            return self._enhance_image(gray)
             
         except Exception as e:
             logger.error(f"Image preprocessing error: {e}")
-            return Image.open(BytesIO(image_data))
+            return np.asarray(Image.open(BytesIO(image_data)).convert('L'))
     
-    def _enhance_image(self, cv_image: np.ndarray) -> np.ndarray:
-        """Apply various image enhancement techniques"""
-        gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        thresh = cv2.adaptiveThreshold(
-            blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-        )
+    def _enhance_image(self, gray: np.ndarray) -> np.ndarray:
+        """Apply various image enhancement techniques to a grayscale image"""
+        # The local thresholds already average over their window, so only the global Otsu pass needs a pre-blur
+        if self.threshold_mode == "sauvola":
+            # Local mean/deviation threshold for unevenly lit photos; not available in OpenCV itself
+            thresh = sauvola_threshold(gray)
+        elif self.threshold_mode == "adaptive":
+            thresh = cv2.adaptiveThreshold(
+                gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, 15, 2
+            )
+        else:
+            # Integer box filter instead of a float Gaussian kernel
+            blurred = cv2.blur(gray, (3, 3))
+            _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
         
         kernel = np.ones((2, 2), np.uint8)
-        cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-        
-        return cv2.cvtColor(cleaned, cv2.COLOR_GRAY2BGR)
+        return cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    
+    def _cache_key(self, image_data: bytes) -> str:
+        """Content-addressed cache key for an uploaded receipt image"""
+        digest = hashlib.sha256(image_data)
+        digest.update(f"|{self.threshold_mode}|{self.tesseract_config}".encode())
+        return f"ocr:{digest.hexdigest()}"
     
     def extract_text_from_receipt(self, image_data: bytes) -> Dict:
-        """Extract and parse text from receipt image"""
+        """Extract and parse text from receipt image, reusing the result for re-uploaded photos"""
+        cache_key = self._cache_key(image_data)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        result = self._extract_text(image_data)
+        if 'error' not in result:
+            cache.set(cache_key, result)
+        return result
+    
+    async def extract_text_from_receipt_async(self, image_data: bytes) -> Dict:
+        """Like extract_text_from_receipt, but runs the OCR pipeline in a worker process off the event loop"""
+        cache_key = self._cache_key(image_data)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Created lazily so importing the service does not start workers. By then the bot runs threads,
+        # an event loop and open sockets, so workers are spawned fresh rather than forked from it.
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.ocr_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        result = await asyncio.get_running_loop().run_in_executor(self._pool, _extract_text_worker, image_data)
+        if 'error' not in result:
+            cache.set(cache_key, result)
+        return result
+    
+    def shutdown(self):
+        """Stop the OCR worker processes, if any were started"""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+    
+    def _extract_text(self, image_data: bytes) -> Dict:
+        """Run preprocessing and Tesseract on a single receipt image"""
         try:
             processed_image = self.preprocess_image(image_data)
             
-            custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,$/€£¥ '
-            raw_text = pytesseract.image_to_string(processed_image, config=custom_config)
-            
-            confidence_data = pytesseract.image_to_data(processed_image, output_type=pytesseract.Output.DICT)
-            avg_confidence = np.mean([int(conf) for conf in confidence_data['conf'] if int(conf) > 0])
-            
-            parsed_data = self._parse_receipt_text(raw_text)
-            parsed_data['raw_text'] = raw_text
-            parsed_data['confidence'] = avg_confidence
-            
-            return parsed_data
+            # One Tesseract pass yields both the words and their confidences
+            data = self._image_to_data(processed_image)
+            lines, avg_confidence = next(iter(self._pages_from_data(data).values()), ([], 0.0))
+            return self._build_result(lines, avg_confidence)
             
         except Exception as e:
             logger.error(f"OCR processing error: {e}")
-            return {
-                'items': [],
-                'total': 0.0,
-                'store_name': None,
-                'date': None,
-                'raw_text': '',
-                'confidence': 0.0,
-                'error': str(e)
-            }
+            return self._empty_result(str(e))
     
-    def _parse_receipt_text(self, text: str) -> Dict:
-        """Parse receipt text to extract structured data"""
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
+    def _image_to_data(self, image: np.ndarray) -> Dict:
+        """Word-level image_to_data DICT, from a persistent libtesseract handle when tesserocr is available"""
+        if self._use_tesserocr:
+            with self._tess_lock:
+                try:
+                    if self._tess_api is None:
+                        self._tess_api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SINGLE_BLOCK, oem=tesserocr.OEM.DEFAULT)
+                        self._tess_api.SetVariable('tessedit_char_whitelist', TESSERACT_WHITELIST)
+                    # Hand libtesseract the raw 8-bit buffer rather than going through a PIL image
+                    height, width = image.shape
+                    self._tess_api.SetImageBytes(image.tobytes(), width, height, 1, width)
+                    tsv = self._tess_api.GetTSVText(0)
+                except RuntimeError as e:
+                    # Typically missing tessdata for the bundled library; keep using the CLI from here on
+                    logger.warning(f"tesserocr unavailable, falling back to pytesseract: {e}")
+                    self._use_tesserocr = False
+                else:
+                    return self._parse_tsv(tsv)
+        
+        return pytesseract.image_to_data(image, config=self.tesseract_config, output_type=pytesseract.Output.DICT)
+    
+    def _parse_tsv(self, tsv: str) -> Dict:
+        """Column lists in pytesseract's image_to_data DICT layout from headerless Tesseract TSV"""
+        data = {column: [] for column in TSV_COLUMNS}
+        numeric_columns = TSV_COLUMNS[:-1]
+        for row in tsv.splitlines():
+            fields = row.split('\t', len(TSV_COLUMNS) - 1)
+            if len(fields) != len(TSV_COLUMNS):
+                continue
+            for column, value in zip(numeric_columns, fields):
+                data[column].append(float(value) if column == 'conf' else int(value))
+            data['text'].append(fields[-1])
+        return data
+    
+    def _pages_from_data(self, data: Dict) -> Dict[int, Tuple[List[str], float]]:
+        """Rebuild each page's text lines and mean word confidence from image_to_data output"""
+        page_lines = {}
+        for page, block, paragraph, line, word in zip(
+            data['page_num'], data['block_num'], data['par_num'], data['line_num'], data['text']
+        ):
+            word = word.strip()
+            if word:
+                page_lines.setdefault(page, {}).setdefault((block, paragraph, line), []).append(word)
+        
+        # Per-page mean of positive confidences, aggregated in NumPy rather than per word in Python
+        pages = np.asarray(data['page_num'], dtype=np.int64)
+        confidences = np.asarray(data['conf'], dtype=np.float64)
+        valid = confidences > 0
+        conf_sums = np.bincount(pages[valid], weights=confidences[valid])
+        conf_counts = np.bincount(pages[valid])
         
+        def page_confidence(page: int) -> float:
+            if page < len(conf_counts) and conf_counts[page]:
+                return float(conf_sums[page] / conf_counts[page])
+            return 0.0
+        
+        return {
+            page: ([' '.join(words) for words in lines.values()], page_confidence(page))
+            for page, lines in page_lines.items()
+        }
+    
+    def _empty_result(self, error: str) -> Dict:
+        """Result returned when OCR fails"""
+        return {
+            'items': [],
+            'total': 0.0,
+            'store_name': None,
+            'date': None,
+            'raw_text': '',
+            'confidence': 0.0,
+            'error': error
+        }
+    
+    def _build_result(self, lines: List[str], confidence: float) -> Dict:
+        """Assemble the OCR result for one page from its recognised lines"""
+        raw_text = '\n'.join(lines)
+        parsed = self._parse_text(raw_text)
+        # Copy the cached dicts so callers can modify their result freely
+        parsed_data = {**parsed, 'items': [dict(item) for item in parsed['items']]}
+        parsed_data['raw_text'] = raw_text
+        parsed_data['confidence'] = confidence
+        return parsed_data
+    
+    def _parse_receipt_text(self, text: str) -> Dict:
+        """Parse newline-joined receipt lines; wrapped in a per-instance LRU cache as _parse_text"""
+        return self._parse_receipt_lines(text.split('\n') if text else [], text)
+    
+    def _parse_receipt_lines(self, lines: List[str], text: str) -> Dict:
+        """Parse receipt lines, as grouped by Tesseract, to extract structured data"""
         result = {
             'items': [],
             'total': 0.0,
@@ -94,17 +252,20 @@ class OCRService:
             'tax': 0.0
         }
         
-        for i, line in enumerate(lines[:5]):
-            if len(line) > 3 and not any(char.isdigit() for char in line):
+        # One pass over the lines; the price matches are kept for the total scan below
+        priced_lines = []
+        for i, line in enumerate(lines):
+            prices = PRICE_RE.findall(line)
+            priced_lines.append((line, prices))
+            
+            if result['store_name'] is None and i < 5 and len(line) > 3 and not DIGIT_RE.search(line):
                 result['store_name'] = line
-                break
-        
-        for line in lines:
-            item_data = self._extract_item_from_line(line)
+            
+            item_data = self._extract_item_from_line(line, prices)
             if item_data:
                 result['items'].append(item_data)
         
-        total = self._extract_total(lines)
+        total = self._extract_total(priced_lines)
         if total:
             result['total'] = total
         
@@ -114,31 +275,28 @@ class OCRService:
         
         return result
     
-    def _extract_item_from_line(self, line: str) -> Optional[Dict]:
-        """Extract item information from a single line"""
-        for pattern in self.item_patterns:
-            match = pattern.match(line.strip())
-            if match:
-                groups = match.groups()
-                if len(groups) == 2:
-                    return {
-                        'name': groups[0].strip(),
-                        'quantity': 1,
-                        'unit_price': float(groups[1].replace(',', '.')),
-                        'total_price': float(groups[1].replace(',', '.'))
-                    }
-                elif len(groups) == 4:
-                    return {
-                        'name': groups[0].strip(),
-                        'quantity': int(groups[1]),
-                        'unit_price': float(groups[2].replace(',', '.')),
-                        'total_price': float(groups[3].replace(',', '.'))
-                    }
-        
-        prices = self.price_pattern.findall(line)
+    def _extract_item_from_line(self, line: str, prices: List[str]) -> Optional[Dict]:
+        """Extract item information from a single line and its already matched prices"""
+        match = ITEM_LINE_RE.match(line)
+        if match:
+            if match['price']:
+                price = float(match['price'].replace(',', '.'))
+                return {
+                    'name': match['name'].strip(),
+                    'quantity': 1,
+                    'unit_price': price,
+                    'total_price': price
+                }
+            return {
+                'name': match['name'].strip(),
+                'quantity': int(match['quantity']),
+                'unit_price': float(match['unit_price'].replace(',', '.')),
+                'total_price': float(match['total_price'].replace(',', '.'))
+            }
+        
         if prices and len(line.split()) > 1:
             price = float(prices[-1].replace(',', '.'))
-            item_name = re.sub(self.price_pattern, '', line).strip()
+            item_name = PRICE_RE.sub('', line).strip()
             if item_name and len(item_name) > 2:
                 return {
                     'name': item_name,
@@ -149,21 +307,13 @@ class OCRService:
         
         return None
     
-    def _extract_total(self, lines: List[str]) -> Optional[float]:
-        """Extract total amount from receipt"""
-        total_keywords = ['total', 'sum', 'amount', 'gesamt', 'suma']
+    def _extract_total(self, priced_lines: List[Tuple[str, List[str]]]) -> Optional[float]:
+        """Extract total amount from (line, prices) pairs of a receipt"""
+        for line, prices in reversed(priced_lines):
+            if prices and TOTAL_KEYWORD_RE.search(line):
+                return float(prices[-1].replace(',', '.'))
         
-        for line in reversed(lines):
-            line_lower = line.lower()
-            if any(keyword in line_lower for keyword in total_keywords):
-                prices = self.price_pattern.findall(line)
-                if prices:
-                    return float(prices[-1].replace(',', '.'))
-        
-        all_prices = []
-        for line in lines:
-            prices = self.price_pattern.findall(line)
-            all_prices.extend([float(p.replace(',', '.')) for p in prices])
+        all_prices = [float(p.replace(',', '.')) for _, prices in priced_lines for p in prices]
         
         if all_prices:
             return max(all_prices)
@@ -172,12 +322,7 @@ class OCRService:
     
     def _extract_date(self, text: str) -> Optional[str]:
         """Extract date from receipt text"""
-        date_patterns = [
-            re.compile(r'(\d{1,2}[./]\d{1,2}[./]\d{2,4})'),
-            re.compile(r'(\d{2,4}[-]\d{1,2}[-]\d{1,2})'),
-        ]
-        
-        for pattern in date_patterns:
+        for pattern in DATE_RES:
             match = pattern.search(text)
             if match:
                 return match.group(1)
@@ -185,3 +330,7 @@ class OCRService:
         return None
 
 ocr_service = OCRService()
+
+def _extract_text_worker(image_data: bytes) -> Dict:
+    """Process pool entry point; each worker runs the pipeline with its own module-level service"""
+    return ocr_service._extract_text(image_data)
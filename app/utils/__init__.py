@@ -0,0 +1,2 @@
+from app.services.i18n_service import i18n
+from app.utils.helpers import format_currency
@@ -1,48 +1,78 @@
 import re
-from typing import List, Dict, Optional
+from itertools import islice
+from typing import Iterable, Iterator, List, Dict, Optional
 from datetime import datetime, timedelta
 
+from dateutil.parser import parse as parse_date
+from rapidfuzz import fuzz, process
+
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s,.-]')
+# ASCII equivalent of _SPECIAL_CHARS_RE for str.translate
+_ASCII_SPECIAL_CHARS = str.maketrans('', '', ''.join(
+    char for char in map(chr, range(128)) if not (char.isalnum() or char.isspace() or char in '_,.-')
+))
+# Common receipt date layouts, tried with strptime before falling back to dateutil
+_DATE_FORMATS = (
+    "%d/%m/%Y", "%m/%d/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d.%m.%Y",
+    "%d/%m/%y", "%m/%d/%y", "%d.%m.%y"
+)
+# A number followed by a unit wins over an earlier bare count, so "2 x 3kg" is 3 kg
+_QUANTITY_UNIT_RE = re.compile(r'(?P<num>\d+(?:\.\d+)?)\s*(?P<unit>kg|g|lb|l|ml|oz|pieces?|pcs?)')
+_QUANTITY_RE = re.compile(r'(?P<num>\d+(?:\.\d+)?)')
+
 def clean_text(text: str) -> str:
     """Clean and normalize text input"""
     if not text:
         return ""
     
-    # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text.strip())
-    
-    # Remove special characters but keep basic punctuation
-    text = re.sub(r'[^\w\s,.-]', '', text)
+    # Remove special characters but keep basic punctuation; accented input still needs the Unicode-aware regex
+    if text.isascii():
+        text = text.translate(_ASCII_SPECIAL_CHARS)
+    else:
+        text = _SPECIAL_CHARS_RE.sub('', text)
     
-    return text
+    # Collapse and trim whitespace
+    return ' '.join(text.split())
 
 def parse_quantity(text: str) -> Dict[str, any]:
     """Parse quantity from text like '2kg', '1.5L', '3 pieces'"""
-    patterns = [
-        r'(\d+(?:\.\d+)?)\s*(kg|g|l|ml|oz|lb|pieces?|pcs?)',
-        r'(\d+(?:\.\d+)?)\s*x',
-        r'(\d+(?:\.\d+)?)'
-    ]
+    text = text.lower()
+    match = _QUANTITY_UNIT_RE.search(text)
+    if match:
+        return {'quantity': float(match.group('num')), 'unit': match.group('unit')}
     
-    for pattern in patterns:
-        match = re.search(pattern, text.lower())
-        if match:
-            quantity = float(match.group(1))
-            unit = match.group(2) if len(match.groups()) > 1 else 'piece'
-            return {'quantity': quantity, 'unit': unit}
+    match = _QUANTITY_RE.search(text)
+    if match:
+        return {'quantity': float(match.group('num')), 'unit': 'piece'}
     
     return {'quantity': 1.0, 'unit': 'piece'}
 
+def parse_receipt_date(text: str) -> Optional[datetime]:
+    """Parse a receipt date, trying known formats per token before fuzzy parsing"""
+    for token in text.split():
+        for fmt in _DATE_FORMATS:
+            try:
+                return datetime.strptime(token, fmt)
+            except ValueError:
+                continue
+    try:
+        return parse_date(text, fuzzy=True)
+    except (ValueError, OverflowError):
+        return None
+
+_CURRENCY_FORMATTERS = {
+    'USD': '${:.2f}'.format,
+    'EUR': '€{:.2f}'.format,
+    'GBP': '£{:.2f}'.format,
+    'BRL': 'R${:.2f}'.format
+}
+
 def format_currency(amount: float, currency: str = 'USD') -> str:
     """Format currency amount"""
-    symbols = {
-        'USD': '$',
-        'EUR': '€',
-        'GBP': '£',
-        'BRL': 'R$'
-    }
-    
-    symbol = symbols.get(currency, currency)
-    return f"{symbol}{amount:.2f}"
+    formatter = _CURRENCY_FORMATTERS.get(currency)
+    if formatter is None:
+        return f"{currency}{amount:.2f}"
+    return formatter(amount)
 
 def calculate_savings(current_price: float, average_price: float) -> Dict:
     """Calculate savings percentage and amount"""
@@ -57,55 +87,37 @@ def calculate_savings(current_price: float, average_price: float) -> Dict:
         'amount': round(savings_amount, 2)
     }
 
-def get_time_ago(timestamp: datetime) -> str:
-    """Get human-readable time ago string"""
-    now = datetime.utcnow()
-    diff = now - timestamp
+def get_time_ago(timestamp: datetime, now: Optional[datetime] = None) -> str:
+    """Get human-readable time ago string; pass `now` once when rendering many timestamps"""
+    seconds = int(((now or datetime.utcnow()) - timestamp).total_seconds())
     
-    if diff.days > 0:
-        return f"{diff.days} day{'s' if diff.days > 1 else ''} ago"
-    elif diff.seconds > 3600:
-        hours = diff.seconds // 3600
+    if seconds >= 86400:
+        days = seconds // 86400
+        return f"{days} day{'s' if days > 1 else ''} ago"
+    elif seconds > 3600:
+        hours = seconds // 3600
         return f"{hours} hour{'s' if hours > 1 else ''} ago"
-    elif diff.seconds > 60:
-        minutes = diff.seconds // 60
+    elif seconds > 60:
+        minutes = seconds // 60
         return f"{minutes} minute{'s' if minutes > 1 else ''} ago"
     else:
         return "Just now"
 
-def chunk_list(lst: List, chunk_size: int) -> List[List]:
-    """Split list into chunks of specified size"""
-    return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
+def chunk_list(items: Iterable, chunk_size: int) -> Iterator[List]:
+    """Lazily split an iterable into lists of at most chunk_size items"""
+    iterator = iter(items)
+    return iter(lambda: list(islice(iterator, chunk_size)), [])
 
-def fuzzy_match(query: str, options: List[str], threshold: float = 0.6) -> List[str]:
-    """Simple fuzzy matching for product names"""
-    query_lower = query.lower()
-    matches = []
-    
-    for option in options:
-        option_lower = option.lower()
-        
-        # Exact match
-        if query_lower == option_lower:
-            matches.append((option, 1.0))
-            continue
-        
-        # Contains match
-        if query_lower in option_lower or option_lower in query_lower:
-            matches.append((option, 0.8))
-            continue
-        
-        # Word overlap
-        query_words = set(query_lower.split())
-        option_words = set(option_lower.split())
-        overlap = len(query_words & option_words)
-        total_words = len(query_words | option_words)
-        
-        if total_words > 0:
-            score = overlap / total_words
-            if score >= threshold:
-                matches.append((option, score))
-    
-    # Sort by score and return
-    matches.sort(key=lambda x: x[1], reverse=True)
-    return [match[0] for match in matches]
+def fuzzy_match(query: str, options: List[str], threshold: float = 0.6, limit: Optional[int] = None) -> List[str]:
+    """Fuzzy matching for product names, optionally keeping only the best `limit` matches"""
+    # token_set_ratio scores exact and subset matches at 100 and otherwise compares the word sets, in C;
+    # the processor lowercases the query and each option as they are scored
+    matches = process.extract(
+        query,
+        options,
+        scorer=fuzz.token_set_ratio,
+        processor=str.lower,
+        score_cutoff=threshold * 100,
+        limit=limit
+    )
+    return [option for option, _score, _index in matches]
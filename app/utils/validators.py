@@ -3,6 +3,16 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Allow letters, numbers, spaces, and common punctuation
+_ITEM_NAME_RE = re.compile(r'\A[a-zA-Z0-9\s\-\,\.\(\)]+\Z')
+
+# Common SQL injection patterns, matched in a single scan
+_SQL_INJECTION_RE = re.compile(r'\b(?:SELECT|INSERT|DELETE|UPDATE)\b|--|;', re.IGNORECASE)
+
+SUPPORTED_CURRENCIES = ("USD", "EUR", "GBP", "BRL")
+_VALID_CURRENCIES = frozenset(SUPPORTED_CURRENCIES)
+_VALID_LANGUAGES = frozenset({"en", "pt_br"})
+
 def validate_item_name(item_name: str) -> bool:
     """
     Validate item name to prevent XSS and SQL injection.
@@ -12,17 +22,21 @@ def validate_item_name(item_name: str) -> bool:
         logger.warning(f"Invalid item name length: {item_name}")
         return False
     
-    # Allow letters, numbers, spaces, and common punctuation
-    pattern = r'^[a-zA-Z0-9\s\-\,\.\(\)]+$'
-    if not re.match(pattern, item_name):
+    if not _ITEM_NAME_RE.match(item_name):
         logger.warning(f"Invalid characters in item name: {item_name}")
         return False
     
     # Prevent common SQL injection patterns
-    dangerous_patterns = [r'\bSELECT\b', r'\bINSERT\b', r'\bDELETE\b', r'\bUPDATE\b', r'--', r';']
-    for pattern in dangerous_patterns:
-        if re.search(pattern, item_name, re.IGNORECASE):
-            logger.warning(f"Potential SQL injection detected: {item_name}")
-            return False
+    if _SQL_INJECTION_RE.search(item_name):
+        logger.warning(f"Potential SQL injection detected: {item_name}")
+        return False
     
-    return True
\ No newline at end of file
+    return True
+
+def validate_currency_code(code: str) -> bool:
+    """Check an upper-cased currency code against the supported currencies"""
+    return code in _VALID_CURRENCIES
+
+def validate_language_code(code: str) -> bool:
+    """Check a lower-cased language code against the supported languages"""
+    return code in _VALID_LANGUAGES
\ No newline at end of file
@@ -1,7 +1,7 @@
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     telegram_id INTEGER UNIQUE,
-    username TEXT UNIQUE,
+    username TEXT,
     first_name TEXT,
     last_name TEXT,
     language_code TEXT DEFAULT 'en',
@@ -13,6 +13,7 @@ CREATE TABLE IF NOT EXISTS users (
 CREATE TABLE IF NOT EXISTS products (
     id SERIAL PRIMARY KEY,
     name TEXT,
+    brand TEXT NOT NULL DEFAULT '',
     category TEXT,
     last_price REAL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -69,19 +70,25 @@ CREATE TABLE IF NOT EXISTS receipt_items (
     FOREIGN KEY (product_id) REFERENCES products(id)
 );
 
+-- Partitioned by month; the bot creates upcoming monthly partitions on startup
+-- and daily, the default partition only catches rows outside those ranges
 CREATE TABLE IF NOT EXISTS price_history (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     product_id INTEGER NOT NULL,
     price REAL NOT NULL,
     currency TEXT DEFAULT 'USD',
-    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, recorded_at),
     FOREIGN KEY (product_id) REFERENCES products(id)
-);
+) PARTITION BY RANGE (recorded_at);
+
+CREATE TABLE IF NOT EXISTS price_history_default PARTITION OF price_history DEFAULT;
 
-CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id);
-CREATE INDEX IF NOT EXISTS idx_products_name ON products(name);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_products_lower_name_brand ON products(lower(name), brand);
 CREATE INDEX IF NOT EXISTS idx_shopping_lists_user_active ON shopping_lists(user_id, is_active);
+CREATE INDEX IF NOT EXISTS idx_shopping_lists_active_created ON shopping_lists(created_at) WHERE is_active;
 CREATE INDEX IF NOT EXISTS idx_shopping_list_items_list_product ON shopping_list_items(shopping_list_id, product_id);
-CREATE INDEX IF NOT EXISTS idx_receipts_user_date ON receipts(user_id, purchase_date);
-CREATE INDEX IF NOT EXISTS idx_receipt_items_receipt ON receipt_items(receipt_id);
+CREATE INDEX IF NOT EXISTS idx_receipts_user_date ON receipts(user_id, purchase_date DESC) INCLUDE (total_amount);
+CREATE INDEX IF NOT EXISTS idx_receipt_items_receipt_product ON receipt_items(receipt_id, product_id) INCLUDE (total_price, item_name);
 CREATE INDEX IF NOT EXISTS idx_price_history_product_date ON price_history(product_id, recorded_at);
\ No newline at end of file
@@ -0,0 +1,43 @@
+import pytest
+
+from app.core import cache as cache_module
+from app.core.cache import CacheService
+
+
+@pytest.fixture
+def memory_cache(monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise ConnectionError("no redis in tests")
+    
+    monkeypatch.setattr(cache_module.redis, "from_url", unavailable)
+    return CacheService()
+
+
+def test_memory_fallback_honours_ttl(memory_cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    
+    memory_cache.set("key", "value", ttl=60)
+    assert memory_cache.get("key") == "value"
+    
+    now[0] += 61
+    assert memory_cache.get("key") is None
+
+
+def test_memory_fallback_evicts_least_recently_used(memory_cache, monkeypatch):
+    monkeypatch.setattr(cache_module, "MEMORY_CACHE_MAX_ENTRIES", 2)
+    
+    memory_cache.set("a", 1)
+    memory_cache.set("b", 2)
+    memory_cache.get("a")
+    memory_cache.set("c", 3)
+    
+    assert memory_cache.get("a") == 1
+    assert memory_cache.get("b") is None
+    assert memory_cache.get("c") == 3
+
+
+def test_memory_fallback_returns_copies(memory_cache):
+    memory_cache.set("result", {"items": [{"name": "Milk"}]})
+    memory_cache.get("result")["items"].append({"name": "Bread"})
+    assert memory_cache.get("result") == {"items": [{"name": "Milk"}]}
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from app.utils.helpers import parse_quantity, parse_receipt_date
+
+
+def test_parse_receipt_date_known_formats():
+    assert parse_receipt_date("12/03/2024") == datetime(2024, 3, 12)
+    assert parse_receipt_date("2024-03-12") == datetime(2024, 3, 12)
+    assert parse_receipt_date("12.03.2024") == datetime(2024, 3, 12)
+
+
+def test_parse_receipt_date_rejects_garbage():
+    assert parse_receipt_date("99/99/9999") is None
+
+
+def test_parse_quantity_prefers_number_with_unit():
+    assert parse_quantity("2 x 3kg") == {'quantity': 3.0, 'unit': 'kg'}
+
+
+def test_parse_quantity_pounds_are_not_litres():
+    assert parse_quantity("5lb") == {'quantity': 5.0, 'unit': 'lb'}
+
+
+def test_parse_quantity_bare_number_is_pieces():
+    assert parse_quantity("3") == {'quantity': 3.0, 'unit': 'piece'}
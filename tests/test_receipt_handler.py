@@ -0,0 +1,104 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from sqlalchemy.dialects import postgresql
+
+from app.handlers import receipt_handler
+from app.models import Receipt
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+    
+    def all(self):
+        return self._rows
+
+
+class FakeSession:
+    """Records what process_receipt writes; the product upsert resolves every name to id 1"""
+    def __init__(self):
+        self.added = []
+        self.statements = []
+        self.committed = False
+    
+    def add(self, obj):
+        self.added.append(obj)
+    
+    async def flush(self):
+        for obj in self.added:
+            obj.id = 1
+    
+    async def execute(self, stmt, params=None):
+        self.statements.append(stmt)
+        return FakeResult([(1, "Milk")])
+    
+    async def commit(self):
+        self.committed = True
+
+
+def make_update():
+    file = SimpleNamespace(download_as_bytearray=AsyncMock(return_value=bytearray(b"image")))
+    photo = SimpleNamespace(get_file=AsyncMock(return_value=file))
+    return SimpleNamespace(
+        message=SimpleNamespace(photo=[photo], reply_text=AsyncMock()),
+        effective_user=SimpleNamespace(id=42, language_code="en")
+    )
+
+
+def run_receipt(monkeypatch, date, items=None):
+    session = FakeSession()
+    
+    @asynccontextmanager
+    async def fake_db():
+        yield session
+    
+    receipt_data = {
+        "items": items or [{"name": "Milk", "quantity": 1, "unit_price": 1.99, "total_price": 1.99}],
+        "total": 1.99,
+        "store_name": "Corner Store",
+        "date": date,
+        "raw_text": "Corner Store\nMilk 1.99",
+        "confidence": 90.0
+    }
+    monkeypatch.setattr(receipt_handler, "get_async_db", fake_db)
+    monkeypatch.setattr(receipt_handler, "cache", MagicMock())
+    monkeypatch.setattr(receipt_handler, "i18n", MagicMock())
+    monkeypatch.setattr(receipt_handler, "settings", SimpleNamespace(enable_price_tracking=True, enable_ai_suggestions=False))
+    monkeypatch.setattr(
+        receipt_handler.ocr_service, "extract_text_from_receipt_async", AsyncMock(return_value=receipt_data)
+    )
+    
+    asyncio.run(receipt_handler.process_receipt(make_update(), SimpleNamespace()))
+    assert session.committed
+    return next(obj for obj in session.added if isinstance(obj, Receipt)), receipt_data, session
+
+
+def test_saves_receipt_with_detected_date(monkeypatch):
+    receipt, _, _ = run_receipt(monkeypatch, "12/03/2024")
+    assert receipt.purchase_date == datetime(2024, 3, 12)
+
+
+def test_unparseable_date_falls_back_to_now(monkeypatch):
+    before = datetime.now()
+    receipt, _, _ = run_receipt(monkeypatch, "99/99/9999")
+    assert isinstance(receipt.purchase_date, datetime)
+    assert receipt.purchase_date >= before
+
+
+def test_leaves_ocr_result_untouched(monkeypatch):
+    _, receipt_data, _ = run_receipt(monkeypatch, None)
+    assert receipt_data["items"] == [{"name": "Milk", "quantity": 1, "unit_price": 1.99, "total_price": 1.99}]
+
+
+def test_differently_cased_receipts_upsert_one_product(monkeypatch):
+    for name in ("MILK", "milk"):
+        items = [{"name": name, "quantity": 1, "unit_price": 1.99, "total_price": 1.99}]
+        _, _, session = run_receipt(monkeypatch, None, items)
+        
+        upsert = str(session.statements[0].compile(dialect=postgresql.dialect()))
+        # The conflict target is the case-insensitive unique index, so the second receipt updates the first product
+        assert "ON CONFLICT (lower(name), brand) DO UPDATE" in upsert